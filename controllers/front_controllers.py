@@ -1,17 +1,24 @@
-import random
-import string
+from framework.middleware import Middleware
+from models.identity_map import IdentityMap
+from models.models import pool
 
 
-class AddSlash:
-    """Add slash to the end of URL if necessary"""
-    def __call__(self, path):
-        if path[-1] != '/':
-            path = f'{path}/'
-        return path
+class NewIdentityMap(Middleware):
+    """Create per-request IdentityMap"""
+    def before(self, request):
+        IdentityMap.new_current()
 
 
-class AddToken:
-    """Add Token to Request"""
-    def __call__(self, request):
-        token = ''.join(random.choice(string.ascii_letters) for _ in range(32))
-        request['token'] = token
+class ReleaseConnection(Middleware):
+    """Return the thread's DB connection to the pool after the request"""
+    def __call__(self, request, call_next):
+        try:
+            return call_next(request)
+        finally:
+            pool.release()
+
+    async def acall(self, request, call_next):
+        try:
+            return await call_next(request)
+        finally:
+            pool.release()
@@ -1,9 +1,11 @@
+from framework.cache import CachePolicy
+from framework.conditional import make_etag
 from framework.template_controllers import PageController
-from framework.templator import render
+from framework.response import Response
+from framework.templator import render, stream, TemplateEngine
 from framework.wsgi import Application as app
 from logger import Logger
-from models.models import Student, Category, Course, CourseChangeObserverFactory, \
-    MapperRegistry, UnitOfWork
+from models.models import Student, Category, Course, MapperRegistry, UnitOfWork
 from patterns.decorator import class_debug, validate_post_data
 
 
@@ -12,23 +14,60 @@ logger_actions = Logger('actions')  # действия с данными
 
 NO_CATEGORY_ID = 1
 
+# Размер страницы списков по умолчанию и максимальный размер из ?page_size=
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
 
 class ListController(PageController):
+    # отдавать страницу по частям по мере рендеринга шаблона
+    stream = False
+    # таблицы, от которых зависит страница (по умолчанию - таблица модели)
+    tables = ()
+
     def __call__(self, request, *args, **kwargs):
-        data = self.get_queryset()
+        data = self.get_queryset(request)
+        if self.stream:
+            return Response(stream(self.template_name, data=data, request=request), self.response)
         body = render(template_name=self.template_name, data=data, request=request)
         return self.response, body.encode()
 
-    def get_queryset(self):
+    def get_queryset(self, request):
         try:
             mapper = MapperRegistry.get_mapper_by_name(self.model)
-            return mapper.get_all()
+            return mapper.get_page(*self.get_page_params(request))
         except Exception as e:
             print(f'Модель не найдена - {e.args}')
 
+    def get_validators(self, request):
+        """
+        ETag и Last-Modified по версиям таблиц и параметрам страницы,
+        без чтения и рендеринга списка
+        """
+        mapper = MapperRegistry.get_mapper_by_name(self.model)
+        versions = mapper.get_versions(*self.tables)
+        # слабый ETag: страница содержит CSRF-токен, новый при каждом рендеринге
+        etag = make_etag(TemplateEngine().version, self.template_name,
+                         *self.get_page_params(request), *versions, weak=True)
+        last_modified = max((updated_at for _, _, updated_at in versions), default=None)
+        return etag, last_modified
+
+    @staticmethod
+    def get_page_params(request):
+        """Параметры страницы (after, page_size) из строки запроса"""
+        try:
+            after = int(request['data']['after'])
+        except (KeyError, ValueError):
+            after = None
+        try:
+            page_size = min(max(int(request['data']['page_size']), 1), MAX_PAGE_SIZE)
+        except (KeyError, ValueError):
+            page_size = PAGE_SIZE
+        return after, page_size
+
 
 @class_debug
-@app.route('/')
+@app.route('/', cache=CachePolicy(ttl=3600))
 class IndexPage(PageController):
     """
     Контроллер главной страницы
@@ -50,7 +89,7 @@ class TestPage(ListController):
 
 
 @class_debug
-@app.route('/about/')
+@app.route('/about/', cache=CachePolicy(ttl=3600))
 class AboutPage(PageController):
     """
     Контроллер вывода информации о сайте
@@ -61,20 +100,20 @@ class AboutPage(PageController):
 
 
 @class_debug
-@app.route('/contacts/')
+@app.route('/contacts/', methods=('GET', 'POST'))
 class ContactsPage(PageController):
     """
     Контроллер вывода контактов
     """
     def __call__(self, request):
         if request['method'] == 'POST':
-            self.template_name = 'feedback.html'
+            template_name = 'feedback.html'
             print(f'got message from {request["data"]["email"]}: {request["data"]["msg"]}')
             logger_actions.log('Feedback was sent')
         else:
-            self.template_name = 'contacts.html'
+            template_name = 'contacts.html'
 
-        body = render(self.template_name, object_list=self.object_list, request=request)
+        body = render(template_name, object_list=self.object_list, request=request)
         return self.response, body.encode()
 
 
@@ -82,7 +121,9 @@ class ContactsPage(PageController):
 @app.route('/categories/')
 class CategoriesPage(ListController):
     """
-    Контроллер вывода списка категорий
+    Контроллер вывода списка категорий. Страница содержит CSRF-токен и
+    целиком не кэшируется (304 по версиям таблиц), разметка списка
+    кэшируется фрагментом с тегом таблицы
     """
     def __init__(self):
         super().__init__()
@@ -92,7 +133,7 @@ class CategoriesPage(ListController):
 
 @validate_post_data
 @class_debug
-@app.route('/addcategory/')
+@app.route('/addcategory/', methods=('GET', 'POST'))
 class AddCategory(PageController):
     """
     Контроллер добавления категории
@@ -119,7 +160,7 @@ class AddCategory(PageController):
         return self.response, body.encode()
 
 
-@app.route('/categories/delete/')
+@app.route('/categories/delete/<int:id>/', methods=('POST', ))
 class DeleteCategory(PageController):
     """
     Контроллер удаления категории
@@ -153,28 +194,28 @@ class DeleteCategory(PageController):
 @app.route('/courses/')
 class CoursesPage(ListController):
     """
-    Контроллер вывода списка курсов
+    Контроллер вывода списка курсов. Страница отдается по частям и не
+    кэшируется целиком, повторные запросы получают 304 по версиям таблиц
     """
+    stream = True
+    tables = ('courses', 'categories')
+
     def __init__(self):
         super().__init__()
         self.model = 'Course'
         self.template_name = 'courses.html'
 
-    def get_queryset(self):
+    def get_queryset(self, request):
         try:
             mapper = MapperRegistry.get_mapper_by_name(self.model)
-            data = mapper.get_all()
-            cat_mapper = MapperRegistry.get_mapper_by_name('Category')
-            for course in data:
-                course.cat_title = cat_mapper.get_by_id(course.id_category).title
-            return data
+            return mapper.get_page_with_category(*self.get_page_params(request))
         except Exception as e:
             print(f'Модель не найдена - {e.args}')
 
 
 @validate_post_data
 @class_debug
-@app.route('/addcourse/')
+@app.route('/addcourse/', methods=('GET', 'POST'))
 class AddCourse(PageController):
     """
     Контроллер добавления курса
@@ -207,7 +248,7 @@ class AddCourse(PageController):
 
 @validate_post_data
 @class_debug
-@app.route('/courses/update/')
+@app.route('/courses/update/<int:id>/', methods=('GET', 'POST'))
 class UpdateCourse(PageController):
     """
     Контроллер изменения курса
@@ -228,8 +269,6 @@ class UpdateCourse(PageController):
                     request['data']['description'],
                 )
 
-                mapper.attach(CourseChangeObserverFactory.create_observer('sms'))
-                mapper.attach(CourseChangeObserverFactory.create_observer('email'))
                 mapper.update(course)
                 return CoursesPage().redirect(request)
             return ErrorHandler('is_empty', f'/courses/update/{id_course}').redirect(request)
@@ -242,7 +281,7 @@ class UpdateCourse(PageController):
 
 
 @class_debug
-@app.route('/clonecourse/')
+@app.route('/clonecourse/', methods=('GET', 'POST'))
 class CloneCourse(PageController):
     """
     Контроллер клонирования курса
@@ -254,7 +293,7 @@ class CloneCourse(PageController):
     def __call__(self, request):
         mapper = MapperRegistry.get_mapper_by_name('Course')
         if request['method'] == 'POST':
-            id_course = request["data"]["id_course"]
+            id_course = int(request["data"]["id_course"])
             original_course = mapper.get_by_id(id_course)
             cloned_course = Course.clone(original_course)
             cloned_course.title = f'CLONED_{cloned_course.title}'
@@ -267,7 +306,7 @@ class CloneCourse(PageController):
         return self.response, body.encode()
 
 
-@app.route('/courses/delete/')
+@app.route('/courses/delete/<int:id>/', methods=('POST', ))
 class DeleteCourse(PageController):
     """
     Контроллер удаления курса
@@ -297,7 +336,7 @@ class DeleteCourse(PageController):
 
 
 @class_debug
-@app.route('/courses/enroll/')
+@app.route('/courses/enroll/<int:id>/', methods=('GET', 'POST'))
 class EnrollPage(PageController):
     """
     Контроллер записи на курс
@@ -324,8 +363,10 @@ class EnrollPage(PageController):
 @app.route('/students/')
 class StudentsPage(ListController):
     """
-    Контроллер вывода списка студентов
+    Контроллер вывода списка студентов (по частям, см. CoursesPage)
     """
+    stream = True
+
     def __init__(self):
         super().__init__()
         self.template_name = 'students.html'
@@ -334,7 +375,7 @@ class StudentsPage(ListController):
 
 @validate_post_data
 @class_debug
-@app.route('/addstudent/')
+@app.route('/addstudent/', methods=('GET', 'POST'))
 class AddStudent(PageController):
     """
     Контроллер добавления студента
@@ -363,7 +404,7 @@ class AddStudent(PageController):
         return self.response, body.encode()
 
 
-@app.route('/students/delete/')
+@app.route('/students/delete/<int:id>/', methods=('POST', ))
 class DeleteStudent(PageController):
     """
     Контроллер удаления студента
@@ -1,5 +1,7 @@
 import sqlite3
 
+from migrate import migrate
+
 
 con = sqlite3.connect('../db.sqlite')
 cur = con.cursor()
@@ -10,3 +12,5 @@ with open('create_db.sql', 'r') as f:
 cur.executescript(text)
 cur.close()
 con.close()
+
+migrate('../db.sqlite')
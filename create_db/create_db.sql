@@ -1,5 +1,9 @@
 BEGIN TRANSACTION;
 
+DROP TABLE IF EXISTS schema_migrations;
+DROP TABLE IF EXISTS table_versions;
+DROP TABLE IF EXISTS outbox;
+
 DROP TABLE IF EXISTS students;
 
 CREATE TABLE students (
@@ -0,0 +1,74 @@
+import os
+import re
+import sqlite3
+
+
+MIGRATIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations')
+MIGRATION_RE = re.compile(r'^(\d+)_(\w+)\.sql$')
+
+
+def get_migrations(path=MIGRATIONS_PATH) -> list:
+    """Список миграций (версия, имя, путь к файлу), отсортированный по версии"""
+    migrations = []
+    for file_name in os.listdir(path):
+        match = MIGRATION_RE.match(file_name)
+        if match:
+            migrations.append((int(match[1]), match[2], os.path.join(path, file_name)))
+    return sorted(migrations)
+
+
+def split_statements(script) -> list:
+    """Разбить SQL-скрипт на отдельные выражения"""
+    statements = []
+    statement = ''
+    for line in script.splitlines(keepends=True):
+        statement += line
+        if sqlite3.complete_statement(statement):
+            statements.append(statement.strip())
+            statement = ''
+    if statement.strip():
+        statements.append(statement.strip())
+    return statements
+
+
+def migrate(database, path=MIGRATIONS_PATH) -> list:
+    """
+    Применить к БД миграции, еще не отмеченные в таблице schema_migrations.
+    Все миграции применяются в одной транзакции BEGIN IMMEDIATE, поэтому
+    несколько одновременно стартующих воркеров не применят их дважды.
+    Возвращает список примененных версий
+    """
+    connection = sqlite3.connect(database)
+    try:
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS schema_migrations ('
+            'version INTEGER PRIMARY KEY NOT NULL, '
+            'name VARCHAR (128), '
+            'applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP)'
+        )
+        connection.commit()
+
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            applied = {row[0] for row in connection.execute('SELECT version FROM schema_migrations')}
+            versions = []
+            for version, name, file_name in get_migrations(path):
+                if version in applied:
+                    continue
+                with open(file_name, 'r', encoding='utf-8') as f:
+                    script = f.read()
+                for statement in split_statements(script):
+                    connection.execute(statement)
+                connection.execute('INSERT INTO schema_migrations (version, name) VALUES (?, ?)', (version, name))
+                versions.append(version)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        return versions
+    finally:
+        connection.close()
+
+
+if __name__ == '__main__':
+    print(f'Применены миграции: {migrate("../db.sqlite")}')
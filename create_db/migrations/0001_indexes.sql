@@ -0,0 +1,17 @@
+-- Индексы по внешним ключам и уникальность записи студента на курс
+
+CREATE INDEX IF NOT EXISTS idx_courses_id_category ON courses (id_category);
+
+-- перед созданием уникального индекса удаляем повторные записи на курс
+DELETE FROM courses_students
+WHERE id_course_student NOT IN (
+    SELECT MIN(id_course_student) FROM courses_students GROUP BY id_course, id_student
+);
+
+-- SQLite не поддерживает ALTER TABLE ... ADD CONSTRAINT, уникальный индекс
+-- дает то же ограничение UNIQUE(id_course, id_student) и используется
+-- для поиска по id_course
+CREATE UNIQUE INDEX IF NOT EXISTS uq_courses_students_course_student
+ON courses_students (id_course, id_student);
+
+CREATE INDEX IF NOT EXISTS idx_courses_students_id_student ON courses_students (id_student);
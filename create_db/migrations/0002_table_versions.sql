@@ -0,0 +1,50 @@
+-- Версии таблиц для ETag/Last-Modified: триггеры увеличивают версию
+-- и время изменения таблицы при каждой вставке, изменении и удалении строки
+
+CREATE TABLE IF NOT EXISTS table_versions (
+table_name VARCHAR (64) PRIMARY KEY NOT NULL,
+version INTEGER NOT NULL DEFAULT 0,
+updated_at INTEGER NOT NULL DEFAULT (strftime('%s', 'now'))
+);
+
+INSERT OR IGNORE INTO table_versions (table_name) VALUES ('students'), ('categories'), ('courses'), ('courses_students');
+
+CREATE TRIGGER IF NOT EXISTS tv_students_insert AFTER INSERT ON students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'students';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_students_update AFTER UPDATE ON students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'students';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_students_delete AFTER DELETE ON students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'students';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tv_categories_insert AFTER INSERT ON categories BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'categories';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_categories_update AFTER UPDATE ON categories BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'categories';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_categories_delete AFTER DELETE ON categories BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'categories';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tv_courses_insert AFTER INSERT ON courses BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_courses_update AFTER UPDATE ON courses BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_courses_delete AFTER DELETE ON courses BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses';
+END;
+
+CREATE TRIGGER IF NOT EXISTS tv_courses_students_insert AFTER INSERT ON courses_students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses_students';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_courses_students_update AFTER UPDATE ON courses_students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses_students';
+END;
+CREATE TRIGGER IF NOT EXISTS tv_courses_students_delete AFTER DELETE ON courses_students BEGIN
+    UPDATE table_versions SET version = version + 1, updated_at = strftime('%s', 'now') WHERE table_name = 'courses_students';
+END;
@@ -0,0 +1,18 @@
+-- Очередь событий (transactional outbox): событие записывается в той же
+-- транзакции, что и изменение данных, и обрабатывается фоновыми воркерами.
+-- done - обработчики, уже успешно обработавшие событие (через запятую),
+-- locked_until - время, до которого событие захвачено воркером
+
+CREATE TABLE IF NOT EXISTS outbox (
+id_event INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL UNIQUE,
+event VARCHAR (64) NOT NULL,
+payload TEXT NOT NULL,
+status VARCHAR (16) NOT NULL DEFAULT 'pending',
+attempts INTEGER NOT NULL DEFAULT 0,
+available_at REAL NOT NULL DEFAULT (strftime('%s', 'now')),
+locked_until REAL,
+done TEXT NOT NULL DEFAULT '',
+error TEXT
+);
+
+CREATE INDEX IF NOT EXISTS idx_outbox_status_available ON outbox (status, available_at);
@@ -0,0 +1,200 @@
+import inspect
+from tempfile import SpooledTemporaryFile
+
+from framework import tracing
+from framework.body import MAX_UPLOAD_SIZE, SPOOL_SIZE, RequestBodyException, RequestBodyTooLargeException
+from framework.conditional import add_etag, is_not_modified, not_modified, set_validators
+from framework.context import iter_in_context, request_context
+from framework.executor import run_sync
+from framework.middleware import build_async_chain
+from framework.request import Request
+from framework.response import Response
+from framework.wsgi import Application
+
+
+def is_async_controller(controller_class) -> bool:
+    return inspect.iscoroutinefunction(controller_class.__call__)
+
+
+def build_environ(scope, body, size) -> dict:
+    """WSGI environ for an ASGI http scope, body is a file with the request body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'],
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f'HTTP/{scope.get("http_version", "1.1")}',
+        'REMOTE_ADDR': client[0],
+        'CONTENT_LENGTH': str(size),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'asgi.scope': scope,
+    }
+    for name, value in scope.get('headers', ()):
+        key = name.decode('latin-1').upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        elif key == 'CONTENT_LENGTH':
+            continue
+        value = value.decode('latin-1')
+        environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+
+async def send_chunks(send, iterable):
+    """Send a sync iterable of bytes, iterating it in the executor"""
+    chunks = iter(iterable)
+    try:
+        while True:
+            chunk = await run_sync(next, chunks, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
+    await send({'type': 'http.response.body', 'body': b''})
+
+
+class ASGIApplication(Application):
+    """
+    ASGI application over the same routes, controllers and middlewares.
+    Sync controllers run with the whole WSGI middleware chain in the
+    bounded executor (framework.executor), `async def` controllers run in
+    the event loop behind the async version of the chain and may await
+    run_sync(...) for mapper calls and render_async(...) for templates.
+    The request body is read before dispatch, up to MAX_UPLOAD_SIZE,
+    and spooled to a temporary file above SPOOL_SIZE.
+    """
+    def __init__(self, front_controllers=(), middlewares=(), static=None):
+        super().__init__(front_controllers, middlewares, static)
+        self.async_handler = build_async_chain(self.middlewares, self.dispatch_async)
+        self.handle_request_async = tracing.trace_request(self.handle_request_async)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            if scope['type'] == 'websocket':
+                await send({'type': 'websocket.close'})
+            return
+
+        try:
+            body, size = await self.read_body(scope, receive)
+        except RequestBodyException as e:
+            await self.send_response(send, Response(str(e), e.status, content_type='text/plain'), scope)
+            return
+
+        with body:
+            environ = build_environ(scope, body, size)
+            if self.static is not None and environ['PATH_INFO'].startswith(self.static.prefix):
+                if await self.send_static(send, environ):
+                    return
+
+            route, params = self.router.match(environ['PATH_INFO'])
+            request = Request(environ, route, params)
+            controller_class = route.controllers.get(request.method) if route is not None else None
+            if controller_class is not None and is_async_controller(controller_class):
+                response = await self.handle_request_async(request)
+            else:
+                response = await run_sync(self.handle_request, request)
+            await self.send_response(send, response, scope)
+
+    async def handle_request_async(self, request):
+        with request_context(request):
+            try:
+                response = await self.async_handler(request)
+            except RequestBodyException as e:
+                return Response(str(e), e.status, content_type='text/plain')
+        if response.is_streaming:
+            response.body = iter_in_context(request, response.body)
+        return response
+
+    async def dispatch_async(self, request):
+        """Call `async def` controller of the matched route"""
+        environ = request.environ
+        controller = request.route.controllers[request.method]()
+
+        etag = last_modified = None
+        if request.method in ('GET', 'HEAD') and hasattr(controller, 'get_validators'):
+            etag, last_modified = await run_sync(controller.get_validators, request)
+            if is_not_modified(environ, etag, last_modified):
+                return not_modified(etag=etag, last_modified=last_modified)
+
+        response = Response.from_result(await controller(request))
+        set_validators(response, etag, last_modified)
+        return add_etag(environ, response)
+
+    @staticmethod
+    async def read_body(scope, receive):
+        """Request body as (file, size)"""
+        for name, value in scope.get('headers', ()):
+            if name == b'content-length' and value.isdigit() and int(value) > MAX_UPLOAD_SIZE:
+                raise RequestBodyTooLargeException(MAX_UPLOAD_SIZE)
+
+        body = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        size = 0
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            chunk = message.get('body', b'')
+            size += len(chunk)
+            if size > MAX_UPLOAD_SIZE:
+                body.close()
+                raise RequestBodyTooLargeException(MAX_UPLOAD_SIZE)
+            if chunk:
+                body.write(chunk)
+            more_body = message.get('more_body', False)
+        body.seek(0)
+        return body, size
+
+    @staticmethod
+    async def send_response(send, response, scope):
+        headers = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                   for name, value in response.wsgi_headers()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        if scope['method'] == 'HEAD':
+            await send({'type': 'http.response.body', 'body': b''})
+            return
+
+        if not response.is_streaming:
+            await send({'type': 'http.response.body', 'body': b''.join(response.iter_body())})
+            return
+
+        # streaming bodies may be lazy templates, render them in the executor
+        await send_chunks(send, response.iter_body())
+
+    async def send_static(self, send, environ) -> bool:
+        """Send a file of StaticFiles, False when there is no such file"""
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                                  for name, value in headers]
+
+        result = await run_sync(self.static, environ, start_response)
+        if result is None:
+            return False
+        await send({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+        await send_chunks(send, result)
+        return True
+
+    @staticmethod
+    async def lifespan(receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
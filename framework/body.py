@@ -0,0 +1,299 @@
+import json
+from itertools import chain
+from email.message import Message
+from tempfile import SpooledTemporaryFile
+from urllib.parse import unquote_plus
+
+from framework.utils import MultiDict
+
+
+# Size of blocks read from wsgi.input
+CHUNK_SIZE = 64 * 1024
+
+# Max size of urlencoded and JSON bodies
+MAX_FORM_SIZE = 1024 * 1024
+
+# Max size of multipart/form-data bodies
+MAX_UPLOAD_SIZE = 16 * 1024 * 1024
+
+# Max number of fields in a form
+MAX_FIELDS = 1000
+
+# Max size of part headers in a multipart body
+MAX_PART_HEADERS_SIZE = 8 * 1024
+
+# Uploaded files larger than this are spooled to a temporary file
+SPOOL_SIZE = 512 * 1024
+
+# Content types read by parse_form
+FORM_CONTENT_TYPES = ('application/x-www-form-urlencoded', 'multipart/form-data')
+
+
+class RequestBodyException(Exception):
+    status = '400 Bad Request'
+
+    def __init__(self, args):
+        super().__init__(f'Bad request body: {args}')
+
+
+class RequestBodyTooLargeException(RequestBodyException):
+    status = '413 Payload Too Large'
+
+    def __init__(self, max_size):
+        Exception.__init__(self, f'Request body is larger than {max_size} bytes')
+
+
+class UploadedFile:
+    """File field of a multipart body"""
+    __slots__ = ('name', 'filename', 'content_type', 'file', 'size')
+
+    def __init__(self, name, filename, content_type):
+        self.name = name
+        self.filename = filename
+        self.content_type = content_type
+        self.file = SpooledTemporaryFile(max_size=SPOOL_SIZE)
+        self.size = 0
+
+    def write(self, data):
+        self.file.write(data)
+        self.size += len(data)
+
+    def read(self, size=-1):
+        return self.file.read(size)
+
+    def close(self):
+        self.file.close()
+
+    def __repr__(self):
+        return f'<UploadedFile {self.name}: {self.filename} ({self.size} bytes)>'
+
+
+def parse_content_type(header):
+    """Content-Type header as (mime type, params dict)"""
+    message = Message()
+    message['content-type'] = header or 'application/octet-stream'
+    return message.get_content_type(), dict(message.get_params()[1:])
+
+
+def iter_body(environ, max_size, chunk_size=CHUNK_SIZE):
+    """
+    Read wsgi.input in chunks of chunk_size.
+    Raises RequestBodyTooLargeException as soon as the body exceeds max_size,
+    a declared Content-Length above the limit is rejected without reading
+    """
+    stream = environ.get('wsgi.input')
+    if stream is None:
+        return
+    try:
+        length = int(environ.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        raise RequestBodyException('invalid Content-Length')
+    if length > max_size:
+        raise RequestBodyTooLargeException(max_size)
+    if not length and not environ.get('wsgi.input_terminated'):
+        return
+
+    remaining = length or max_size + 1
+    read = 0
+    while remaining > 0:
+        chunk = stream.read(min(chunk_size, remaining))
+        if not chunk:
+            break
+        read += len(chunk)
+        if read > max_size:
+            raise RequestBodyTooLargeException(max_size)
+        remaining -= len(chunk)
+        yield chunk
+
+
+def read_body(environ, max_size=MAX_FORM_SIZE) -> bytes:
+    return b''.join(iter_body(environ, max_size))
+
+
+def _decode_pair(pair, charset):
+    key, _, value = pair.partition(b'=')
+    return (unquote_plus(key.decode('latin-1'), charset, 'replace'),
+            unquote_plus(value.decode('latin-1'), charset, 'replace'))
+
+
+def parse_urlencoded(chunks, charset='utf-8') -> MultiDict:
+    """
+    Parse application/x-www-form-urlencoded body chunk by chunk.
+    Every pair is split before percent-decoding, so encoded '&' and '='
+    stay in values
+    """
+    form = MultiDict()
+    fields = 0
+    tail = b''
+    for chunk in chain(chunks, (b'&',)):
+        pairs = (tail + chunk).split(b'&')
+        tail = pairs.pop()
+        for pair in pairs:
+            if not pair:
+                continue
+            fields += 1
+            if fields > MAX_FIELDS:
+                raise RequestBodyException(f'more than {MAX_FIELDS} fields')
+            form.add(*_decode_pair(pair, charset))
+    return form
+
+
+class MultipartParser:
+    """
+    Incremental multipart/form-data parser.
+    Text fields go to form, file fields to files as UploadedFile
+    spooled to disk above SPOOL_SIZE
+    """
+    def __init__(self, boundary, charset='utf-8', max_field_size=MAX_FORM_SIZE):
+        self.separator = b'\r\n--' + boundary.encode('latin-1')
+        self.charset = charset
+        self.max_field_size = max_field_size
+        self.form = MultiDict()
+        self.files = MultiDict()
+        # the body starts with a separator without the leading CRLF
+        self._buffer = b'\r\n'
+        self._state = 'preamble'
+        self._part = None
+        self._name = None
+        self._fields = 0
+
+    def feed(self, data):
+        self._buffer += data
+        while self._step():
+            pass
+
+    def close(self):
+        if self._state != 'end':
+            for uploaded in self.files.values():
+                uploaded.close()
+            raise RequestBodyException('incomplete multipart body')
+        for uploaded in self.files.values():
+            uploaded.file.seek(0)
+
+    def _step(self) -> bool:
+        """Parse as much of the buffer as possible, False when more data is needed"""
+        buffer = self._buffer
+        if self._state == 'preamble':
+            index = buffer.find(self.separator)
+            if index < 0:
+                self._buffer = buffer[-len(self.separator):]
+                return False
+            self._buffer = buffer[index + len(self.separator):]
+            self._state = 'boundary'
+            return True
+
+        if self._state == 'boundary':
+            if len(buffer) < 2:
+                return False
+            if buffer[:2] == b'--':
+                self._state = 'end'
+                self._buffer = b''
+                return False
+            if buffer[:2] != b'\r\n':
+                raise RequestBodyException('invalid multipart boundary')
+            self._buffer = buffer[2:]
+            self._state = 'headers'
+            return True
+
+        if self._state == 'headers':
+            index = buffer.find(b'\r\n\r\n')
+            if index < 0:
+                if len(buffer) > MAX_PART_HEADERS_SIZE:
+                    raise RequestBodyException('multipart headers are too large')
+                return False
+            self._start_part(buffer[:index])
+            self._buffer = buffer[index + 4:]
+            self._state = 'body'
+            return True
+
+        if self._state == 'body':
+            index = buffer.find(self.separator)
+            if index < 0:
+                # keep a possible beginning of the separator
+                keep = len(self.separator) - 1
+                if len(buffer) > keep:
+                    self._write(buffer[:-keep])
+                    self._buffer = buffer[-keep:]
+                return False
+            self._write(buffer[:index])
+            self._finish_part()
+            self._buffer = buffer[index + len(self.separator):]
+            self._state = 'boundary'
+            return True
+
+        # epilogue after the last boundary is ignored
+        self._buffer = b''
+        return False
+
+    def _start_part(self, raw_headers):
+        self._fields += 1
+        if self._fields > MAX_FIELDS:
+            raise RequestBodyException(f'more than {MAX_FIELDS} fields')
+        message = Message()
+        for line in raw_headers.decode(self.charset, 'replace').split('\r\n'):
+            name, _, value = line.partition(':')
+            message[name.strip()] = value.strip()
+        name = message.get_param('name', header='content-disposition')
+        if name is None:
+            raise RequestBodyException('multipart part without name')
+        self._name = name
+        filename = message.get_filename()
+        if filename is None:
+            self._part = bytearray()
+        else:
+            self._part = UploadedFile(name, filename, message.get_content_type())
+
+    def _write(self, data):
+        if isinstance(self._part, bytearray):
+            if len(self._part) + len(data) > self.max_field_size:
+                raise RequestBodyTooLargeException(self.max_field_size)
+            self._part += data
+        else:
+            self._part.write(data)
+
+    def _finish_part(self):
+        if isinstance(self._part, bytearray):
+            self.form.add(self._name, self._part.decode(self.charset, 'replace'))
+        else:
+            self.files.add(self._name, self._part)
+        self._part = self._name = None
+
+
+def parse_multipart(chunks, boundary, charset='utf-8'):
+    """Parse multipart/form-data body, returns (form, files)"""
+    parser = MultipartParser(boundary, charset)
+    for chunk in chunks:
+        parser.feed(chunk)
+    parser.close()
+    return parser.form, parser.files
+
+
+def is_form(environ) -> bool:
+    """True if parse_form reads the body of the request"""
+    return parse_content_type(environ.get('CONTENT_TYPE'))[0] in FORM_CONTENT_TYPES
+
+
+def parse_form(environ):
+    """
+    Parse urlencoded or multipart body of the request.
+    Returns (form, files) MultiDicts, other content types give empty ones
+    """
+    content_type, params = parse_content_type(environ.get('CONTENT_TYPE'))
+    charset = params.get('charset', 'utf-8')
+    if content_type == 'application/x-www-form-urlencoded':
+        return parse_urlencoded(iter_body(environ, MAX_FORM_SIZE), charset), MultiDict()
+    if content_type == 'multipart/form-data':
+        boundary = params.get('boundary')
+        if not boundary:
+            raise RequestBodyException('multipart body without boundary')
+        return parse_multipart(iter_body(environ, MAX_UPLOAD_SIZE), boundary, charset)
+    return MultiDict(), MultiDict()
+
+
+def parse_json(body: bytes):
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError as e:
+        raise RequestBodyException(f'invalid JSON: {e}')
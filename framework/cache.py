@@ -0,0 +1,234 @@
+import marshal
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from markupsafe import Markup
+
+from framework.response import Response
+
+
+class CachePolicy:
+    """
+    Per-route response cache settings.
+    tags - invalidation tags (e.g. table names) the page depends on,
+    vary - request headers that are part of the cache key
+    """
+    def __init__(self, ttl=300, tags=(), vary=()):
+        self.ttl = ttl
+        self.tags = tuple(tags)
+        self.vary = tuple(f'HTTP_{header.upper().replace("-", "_")}' for header in vary)
+
+
+class MemoryCacheBackend:
+    """
+    In-process LRU backend.
+    Invalidation is only seen by the process it happens in, use
+    SqliteCacheBackend when several workers serve the same data.
+    """
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._tags = {}
+        self._generations = {}
+        self._lock = threading.Lock()
+
+    def generation(self, tags):
+        with self._lock:
+            return tuple(self._generations.get(tag, 0) for tag in tags)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, tags, value = entry
+            if expires_at < time.time():
+                self._delete(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl, tags=(), generation=None):
+        with self._lock:
+            if generation is not None and generation != tuple(self._generations.get(tag, 0) for tag in tags):
+                return
+            self._delete(key)
+            self._entries[key] = (time.time() + ttl, tags, value)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._delete(next(iter(self._entries)))
+
+    def invalidate_tags(self, *tags):
+        with self._lock:
+            for tag in tags:
+                self._generations[tag] = self._generations.get(tag, 0) + 1
+                for key in self._tags.pop(tag, ()):
+                    self._delete(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._tags.clear()
+
+    def _delete(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            for tag in entry[1]:
+                keys = self._tags.get(tag)
+                if keys is not None:
+                    keys.discard(key)
+
+
+class SqliteCacheBackend:
+    """
+    Backend in a SQLite file shared by all workers of the host.
+    Values (tuples, lists, str, bytes) are stored with marshal
+    """
+    def __init__(self, database='cache.sqlite', busy_timeout=5000):
+        self.database = database
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        connection = self._connection()
+        connection.executescript(
+            'CREATE TABLE IF NOT EXISTS response_cache ('
+            'key TEXT PRIMARY KEY NOT NULL, value BLOB, expires_at REAL);'
+            'CREATE TABLE IF NOT EXISTS response_cache_tags ('
+            'tag TEXT NOT NULL, key TEXT NOT NULL, PRIMARY KEY (tag, key)) WITHOUT ROWID;'
+            'CREATE INDEX IF NOT EXISTS idx_response_cache_tags_key ON response_cache_tags (key);'
+            'CREATE TABLE IF NOT EXISTS response_cache_generations ('
+            'tag TEXT PRIMARY KEY NOT NULL, generation INTEGER NOT NULL) WITHOUT ROWID;'
+        )
+
+    def get(self, key):
+        row = self._connection().execute(
+            'SELECT value FROM response_cache WHERE key=? AND expires_at>?', (key, time.time())
+        ).fetchone()
+        return marshal.loads(row[0]) if row else None
+
+    def generation(self, tags):
+        return self._generation(self._connection(), tags)
+
+    def set(self, key, value, ttl, tags=(), generation=None):
+        connection = self._connection()
+        with connection:
+            # the write lock is taken before the check, so invalidation of
+            # another process can't happen between the check and the insert
+            connection.execute('BEGIN IMMEDIATE')
+            if generation is not None and generation != self._generation(connection, tags):
+                return
+            connection.execute(
+                'INSERT OR REPLACE INTO response_cache (key, value, expires_at) VALUES (?, ?, ?)',
+                (key, marshal.dumps(value), time.time() + ttl))
+            connection.executemany(
+                'INSERT OR IGNORE INTO response_cache_tags (tag, key) VALUES (?, ?)',
+                [(tag, key) for tag in tags])
+
+    def invalidate_tags(self, *tags):
+        if not tags:
+            return
+        placeholders = ', '.join('?' * len(tags))
+        keys = f'SELECT key FROM response_cache_tags WHERE tag IN ({placeholders})'
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                'INSERT INTO response_cache_generations (tag, generation) VALUES (?, 1) '
+                'ON CONFLICT (tag) DO UPDATE SET generation = generation + 1', [(tag, ) for tag in tags])
+            connection.execute(f'DELETE FROM response_cache WHERE key IN ({keys})', tags)
+            connection.execute(f'DELETE FROM response_cache_tags WHERE key IN ({keys})', tags)
+
+    def clear(self):
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM response_cache')
+            connection.execute('DELETE FROM response_cache_tags')
+
+    @staticmethod
+    def _generation(connection, tags):
+        if not tags:
+            return ()
+        placeholders = ', '.join('?' * len(tags))
+        generations = dict(connection.execute(
+            f'SELECT tag, generation FROM response_cache_generations WHERE tag IN ({placeholders})', tags))
+        return tuple(generations.get(tag, 0) for tag in tags)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+
+class ResponseCache:
+    """
+    Full-page and fragment cache on top of a backend.
+    generation() is taken before rendering and checked when storing, so a
+    page rendered from data older than the last invalidation of its tags
+    is not cached
+    """
+    def __init__(self, backend=None):
+        self.backend = backend if backend is not None else MemoryCacheBackend()
+
+    @staticmethod
+    def make_key(environ, policy):
+        # HEAD is answered from the GET entry
+        method = 'GET' if environ['REQUEST_METHOD'] == 'HEAD' else environ['REQUEST_METHOD']
+        key = f'{method} {environ["PATH_INFO"]}?{environ.get("QUERY_STRING", "")}'
+        for header in policy.vary:
+            key = f'{key}|{environ.get(header, "")}'
+        return key
+
+    def get_response(self, key):
+        value = self.backend.get(key)
+        if value is None:
+            return None
+        status, headers, body = value
+        return Response(body, status, [tuple(header) for header in headers], content_type=None)
+
+    def generation(self, policy):
+        """Invalidation counters of the policy tags"""
+        return self.backend.generation(policy.tags)
+
+    def store_response(self, key, response, policy, generation=None):
+        """
+        Cache public 200 responses without cookies.
+        Streaming responses are passed through, so they keep streaming
+        """
+        if response.status_code != 200 or response.cookies or response.is_streaming:
+            return response
+        cache_control = (response.get_header('Cache-Control') or '').lower()
+        if 'private' in cache_control or 'no-store' in cache_control:
+            return response
+        headers = [header for header in response.wsgi_headers() if header[0].lower() != 'set-cookie']
+        body = b''.join(response.iter_body())
+        self.backend.set(key, (response.status, headers, body), policy.ttl, policy.tags, generation)
+        return response
+
+    def fragment(self, name, render, ttl=300, tags=()):
+        """Cached result of render() for a template fragment"""
+        key = f'fragment:{name}'
+        value = self.backend.get(key)
+        if value is None:
+            generation = self.backend.generation(tags)
+            value = render()
+            self.backend.set(key, value, ttl, tags, generation)
+        return value
+
+    def template_fragment(self, name, ttl=300, tags=(), caller=None):
+        """
+        `fragment` template global, the call block body is rendered only on
+        a cache miss: {% call fragment('name', tags=('table', )) %}...{% endcall %}.
+        The body must not depend on the user (CSRF tokens, session)
+        """
+        return Markup(self.fragment(name, caller, ttl, tags))
+
+    def invalidate_tags(self, *tags):
+        self.backend.invalidate_tags(*tags)
+
+    def clear(self):
+        self.backend.clear()
@@ -0,0 +1,167 @@
+import hashlib
+import threading
+import zlib
+from collections import OrderedDict
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# Content types worth compressing (prefix match)
+COMPRESSIBLE_TYPES = ('text/', 'application/json', 'application/javascript', 'application/xml', 'image/svg+xml')
+
+
+def parse_accept_encoding(header) -> dict:
+    """Accept-Encoding header as {encoding: q}"""
+    encodings = {}
+    for item in header.split(','):
+        encoding, _, params = item.strip().partition(';')
+        if not encoding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        encodings[encoding.strip().lower()] = q
+    return encodings
+
+
+class GzipEncoder:
+    name = 'gzip'
+
+    def __init__(self, level):
+        # wbits=31 - zlib stream with gzip header and trailer
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data):
+        return self._compressor.compress(data)
+
+    def flush(self):
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self):
+        return self._compressor.flush()
+
+
+class BrotliEncoder:
+    name = 'br'
+
+    def __init__(self, level):
+        self._compressor = brotli.Compressor(quality=min(level, 11))
+
+    def compress(self, data):
+        return self._compressor.process(data)
+
+    def flush(self):
+        return self._compressor.flush()
+
+    def finish(self):
+        return self._compressor.finish()
+
+
+ENCODERS = {'gzip': GzipEncoder}
+if brotli is not None:
+    ENCODERS['br'] = BrotliEncoder
+
+
+def is_shared(response) -> bool:
+    """False for responses that may differ per user"""
+    if response.cookies:
+        return False
+    cache_control = (response.get_header('Cache-Control') or '').lower()
+    if 'private' in cache_control or 'no-store' in cache_control:
+        return False
+    vary = (response.get_header('Vary') or '').lower()
+    return 'cookie' not in (item.strip() for item in vary.split(','))
+
+
+class Compressor:
+    """
+    Response compression with Accept-Encoding negotiation.
+    Bodies smaller than min_size are sent as is, streaming bodies are
+    compressed chunk by chunk. Compressed bodies of responses that are the
+    same for every user (no cookies, not private, no Vary: Cookie) are kept
+    in an LRU of cache_size entries keyed by a hash of the uncompressed
+    body, so repeated hits of public pages are not compressed again.
+    """
+    def __init__(self, min_size=1024, level=6, cache_size=256, preferred=('br', 'gzip')):
+        self.min_size = min_size
+        self.level = level
+        self.cache_size = cache_size
+        self.preferred = tuple(encoding for encoding in preferred if encoding in ENCODERS)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def choose_encoding(self, environ):
+        accepted = parse_accept_encoding(environ.get('HTTP_ACCEPT_ENCODING', ''))
+        if not accepted:
+            return None
+        for encoding in self.preferred:
+            if accepted.get(encoding, accepted.get('*', 0)) > 0:
+                return encoding
+        return None
+
+    def compress(self, environ, response):
+        if response.status_code < 200 or response.status_code in (204, 304) \
+                or response.get_header('Content-Encoding') is not None:
+            return response
+        content_type = response.get_header('Content-Type') or response.content_type or ''
+        if not content_type.startswith(COMPRESSIBLE_TYPES):
+            return response
+
+        response.add_vary('Accept-Encoding')
+        encoding = self.choose_encoding(environ)
+        if encoding is None:
+            return response
+
+        length = response.content_length()
+        if length is not None and length < self.min_size:
+            return response
+
+        etag = response.get_header('ETag')
+        if length is None:
+            response.body = self._compress_stream(encoding, response.iter_body())
+        else:
+            response.body = self._compress_cached(encoding, b''.join(response.iter_body()), is_shared(response))
+            response.delete_header('Content-Length')
+
+        response.set_header('Content-Encoding', encoding)
+        if etag is not None and not etag.startswith('W/'):
+            # the compressed representation is no longer byte-identical
+            response.set_header('ETag', f'W/{etag}')
+        return response
+
+    def _compress_cached(self, encoding, body, shared):
+        if not shared or not self.cache_size:
+            return self._compress(encoding, body)
+        # validators of controllers don't guarantee identical bytes, the key
+        # is the body itself
+        key = (hashlib.blake2b(body, digest_size=16).digest(), encoding)
+        with self._lock:
+            compressed = self._cache.get(key)
+            if compressed is not None:
+                self._cache.move_to_end(key)
+                return compressed
+        compressed = self._compress(encoding, body)
+        with self._lock:
+            self._cache[key] = compressed
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compressed
+
+    def _compress(self, encoding, body):
+        encoder = ENCODERS[encoding](self.level)
+        return encoder.compress(body) + encoder.finish()
+
+    def _compress_stream(self, encoding, chunks):
+        encoder = ENCODERS[encoding](self.level)
+        for chunk in chunks:
+            data = encoder.compress(chunk) + encoder.flush()
+            if data:
+                yield data
+        yield encoder.finish()
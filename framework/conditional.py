@@ -0,0 +1,101 @@
+import hashlib
+from email.utils import formatdate, parsedate_to_datetime
+
+from framework.response import Response
+
+
+# Headers of the full response that are repeated in 304 Not Modified
+NOT_MODIFIED_HEADERS = ('cache-control', 'content-location', 'date', 'etag', 'expires', 'last-modified', 'vary')
+
+
+def make_etag(*parts, weak=False) -> str:
+    """
+    ETag from arbitrary values (body bytes, versions, ...).
+    Strong only for a hash of the body, validators built from versions
+    don't guarantee identical bytes and must be weak
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part if isinstance(part, bytes) else str(part).encode())
+        digest.update(b'\0')
+    return f'W/"{digest.hexdigest()}"' if weak else f'"{digest.hexdigest()}"'
+
+
+def http_date(timestamp) -> str:
+    return formatdate(timestamp, usegmt=True)
+
+
+def is_not_modified(environ, etag=None, last_modified=None) -> bool:
+    """
+    Check If-None-Match / If-Modified-Since of the request.
+    last_modified - unix timestamp, If-Modified-Since is ignored when
+    If-None-Match is present
+    """
+    if_none_match = environ.get('HTTP_IF_NONE_MATCH')
+    if if_none_match is not None:
+        if etag is None:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # If-None-Match uses weak comparison
+        etag = etag[2:] if etag.startswith('W/') else etag
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if (tag[2:] if tag.startswith('W/') else tag) == etag:
+                return True
+        return False
+
+    if_modified_since = environ.get('HTTP_IF_MODIFIED_SINCE')
+    if if_modified_since is not None and last_modified is not None:
+        try:
+            return int(last_modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def not_modified(response=None, etag=None, last_modified=None) -> Response:
+    """304 response keeping the validator headers of response"""
+    headers = []
+    if response is not None:
+        headers = [header for header in response.headers if header[0].lower() in NOT_MODIFIED_HEADERS]
+    result = Response(b'', '304 Not Modified', headers, content_type=None)
+    if etag is not None:
+        result.set_header('ETag', etag)
+    if last_modified is not None:
+        result.set_header('Last-Modified', http_date(last_modified))
+    return result
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Set ETag / Last-Modified headers unless the controller did it"""
+    if etag is not None and response.get_header('ETag') is None:
+        response.set_header('ETag', etag)
+    if last_modified is not None and response.get_header('Last-Modified') is None:
+        response.set_header('Last-Modified', http_date(last_modified))
+    return response
+
+
+def add_etag(environ, response):
+    """Add a strong ETag (hash of the body) to a buffered 200 GET/HEAD response"""
+    if environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or response.status_code != 200 \
+            or response.is_streaming or response.get_header('ETag') is not None:
+        return response
+    response.content_length()
+    body = response.body if isinstance(response.body, bytes) else b''.join(response.body)
+    response.set_header('ETag', make_etag(body))
+    return response
+
+
+def conditional_response(environ, response) -> Response:
+    """Replace a 200 GET/HEAD response with 304 when the client copy is current"""
+    if environ['REQUEST_METHOD'] not in ('GET', 'HEAD') or response.status_code != 200:
+        return response
+
+    etag = response.get_header('ETag')
+    last_modified = response.get_header('Last-Modified')
+    if last_modified is not None:
+        last_modified = parsedate_to_datetime(last_modified).timestamp()
+    if is_not_modified(environ, etag, last_modified):
+        return not_modified(response)
+    return response
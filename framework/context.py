@@ -0,0 +1,47 @@
+import contextvars
+
+
+_request = contextvars.ContextVar('request', default=None)
+
+_END = object()
+
+
+def get_request():
+    """Request being handled in the current thread or task, None outside of a request"""
+    return _request.get()
+
+
+class request_context:
+    """Bind the request to the current context for the duration of the block"""
+    __slots__ = ('request', '_token')
+
+    def __init__(self, request):
+        self.request = request
+        self._token = None
+
+    def __enter__(self):
+        self._token = _request.set(self.request)
+        return self.request
+
+    def __exit__(self, *exc_info):
+        _request.reset(self._token)
+        return False
+
+
+def iter_in_context(request, iterable):
+    """
+    Iterate a streaming body with the request bound to the context, so
+    lazily rendered templates see it after the handler has returned
+    """
+    chunks = iter(iterable)
+    try:
+        while True:
+            with request_context(request):
+                chunk = next(chunks, _END)
+            if chunk is _END:
+                return
+            yield chunk
+    finally:
+        close = getattr(iterable, 'close', None)
+        if close is not None:
+            close()
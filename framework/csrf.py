@@ -0,0 +1,108 @@
+import hmac
+import secrets
+
+from framework.context import get_request
+from framework.middleware import Middleware
+from framework.response import Response
+from framework.router import normalize_path
+from framework.signing import b64decode, b64encode, sign, unsign
+from framework.templator import TemplateEngine
+
+
+CSRF_COOKIE_NAME = 'csrftoken'
+CSRF_COOKIE_MAX_AGE = 365 * 24 * 3600
+CSRF_FIELD_NAME = 'csrf_token'
+CSRF_HEADER_NAME = 'X-CSRF-Token'
+
+UNSAFE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# request.context key of (token, is_new)
+_STATE = 'csrf'
+_SALT = 'csrf'
+
+
+def mask_token(token: str) -> str:
+    """
+    Token XOR-ed with a random mask, the mask is prepended.
+    Every page gets a different value, so compressed pages don't leak it (BREACH)
+    """
+    token = token.encode('ascii')
+    mask = secrets.token_bytes(len(token))
+    return b64encode(mask + bytes(a ^ b for a, b in zip(mask, token)))
+
+
+def unmask_token(masked: str):
+    try:
+        data = b64decode(masked)
+    except ValueError:
+        return None
+    size = len(data) // 2
+    mask, token = data[:size], data[size:]
+    try:
+        return bytes(a ^ b for a, b in zip(mask, token)).decode('ascii')
+    except UnicodeDecodeError:
+        return None
+
+
+class CsrfMiddleware(Middleware):
+    """
+    CSRF protection with a signed cookie (double submit).
+    The token is created only when a template calls csrf_token(), the
+    HMAC-signed cookie is set on that response. Streamed HTML pages are
+    rendered after the headers are sent, so they get the token in advance.
+    Unsafe requests must send the token in the csrf_token form field or
+    the X-CSRF-Token header, otherwise they get 403. exempt - route patterns without the check
+    """
+    def __init__(self, exempt=(), secure=False):
+        self.exempt = frozenset(normalize_path(pattern) for pattern in exempt)
+        self.secure = secure
+        TemplateEngine().env.globals['csrf_token'] = self.template_token
+
+    def before(self, request):
+        if request.method not in UNSAFE_METHODS:
+            return None
+        if request.route is not None and request.route.pattern in self.exempt:
+            return None
+        token = self.get_cookie_token(request)
+        submitted = request.get_header(CSRF_HEADER_NAME) or request.form.get(CSRF_FIELD_NAME)
+        if token is None or not submitted or not hmac.compare_digest(unmask_token(submitted) or '', token):
+            return Response('CSRF token missing or incorrect', '403 Forbidden', content_type='text/plain')
+        return None
+
+    def after(self, request, response):
+        state = request.context.get(_STATE)
+        if state is None:
+            if not response.is_streaming or not (response.content_type or '').startswith('text/html'):
+                return response
+            state = self._get_state(request)
+        token, is_new = state
+        if is_new:
+            response.set_cookie(CSRF_COOKIE_NAME, sign(token, _SALT), max_age=CSRF_COOKIE_MAX_AGE,
+                                secure=self.secure)
+        # the page holds a per-user token: keep it out of shared caches
+        response.set_header('Cache-Control', 'private, no-cache')
+        response.add_vary('Cookie')
+        return response
+
+    @staticmethod
+    def get_cookie_token(request):
+        return unsign(request.cookies.get(CSRF_COOKIE_NAME), _SALT)
+
+    def get_token(self, request) -> str:
+        """Masked token for a form, creates the token on first use"""
+        return mask_token(self._get_state(request)[0])
+
+    def _get_state(self, request):
+        state = request.context.get(_STATE)
+        if state is None:
+            token = self.get_cookie_token(request)
+            state = (token, False) if token else (secrets.token_urlsafe(32), True)
+            request.context[_STATE] = state
+        return state
+
+    def template_token(self) -> str:
+        """csrf_token() template global"""
+        request = get_request()
+        if request is None:
+            raise RuntimeError('csrf_token() is called outside of a request')
+        return self.get_token(request)
@@ -0,0 +1,45 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Max number of threads running blocking code (mapper calls, sync
+# controllers) for the ASGI application
+EXECUTOR_WORKERS = 16
+
+# Callables run in the worker thread after each run_sync call (e.g.
+# returning the thread's pooled DB connection)
+cleanup = []
+
+_executor = None
+_lock = threading.Lock()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    """Process-wide bounded executor, created on first use"""
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(EXECUTOR_WORKERS, thread_name_prefix='framework')
+    return _executor
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    Run blocking func in the executor and await the result.
+    The call sees context variables (request, identity map) of the caller
+    """
+    context = contextvars.copy_context()
+    call = functools.partial(context.run, _call, func, args, kwargs)
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), call)
+
+
+def _call(func, args, kwargs):
+    try:
+        return func(*args, **kwargs)
+    finally:
+        for callback in cleanup:
+            callback()
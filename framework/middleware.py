@@ -0,0 +1,209 @@
+import asyncio
+import time
+
+from framework.conditional import conditional_response
+from framework.executor import run_sync
+
+
+class Middleware:
+    """
+    Base middleware.
+    before(request) may return a Response to short-circuit the chain,
+    after(request, response) may replace the response. Override
+    __call__(request, call_next) for logic around the handler.
+    Only overridden hooks end up in the compiled chain.
+    """
+    def before(self, request):
+        return None
+
+    def after(self, request, response):
+        return response
+
+    def __call__(self, request, call_next):
+        response = self.before(request)
+        if response is None:
+            response = call_next(request)
+        return self.after(request, response)
+
+    async def acall(self, request, call_next):
+        response = self.before(request)
+        if response is None:
+            response = await call_next(request)
+        return self.after(request, response)
+
+
+def _overrides(middleware, name):
+    return isinstance(middleware, Middleware) and getattr(type(middleware), name) is not getattr(Middleware, name)
+
+
+def _compile(middleware, call_next):
+    """Handler calling only the hooks the middleware implements"""
+    if not isinstance(middleware, Middleware) or _overrides(middleware, '__call__'):
+        def handler(request):
+            return middleware(request, call_next)
+        return handler
+
+    has_before = _overrides(middleware, 'before')
+    has_after = _overrides(middleware, 'after')
+    before = middleware.before
+    after = middleware.after
+
+    if has_before and has_after:
+        def handler(request):
+            response = before(request)
+            if response is None:
+                response = call_next(request)
+            return after(request, response)
+    elif has_before:
+        def handler(request):
+            response = before(request)
+            if response is None:
+                response = call_next(request)
+            return response
+    elif has_after:
+        def handler(request):
+            return after(request, call_next(request))
+    else:
+        handler = call_next
+    return handler
+
+
+def _compile_async(middleware, call_next):
+    """Async version of _compile, call_next is a coroutine function"""
+    if _overrides(middleware, 'acall'):
+        acall = middleware.acall
+
+        async def handler(request):
+            return await acall(request, call_next)
+        return handler
+
+    if not isinstance(middleware, Middleware) or _overrides(middleware, '__call__'):
+        # sync middleware around the handler: run it in the executor
+        # and the rest of the chain back in the event loop
+        async def handler(request):
+            loop = asyncio.get_running_loop()
+
+            def sync_next(request):
+                return asyncio.run_coroutine_threadsafe(call_next(request), loop).result()
+            return await run_sync(middleware, request, sync_next)
+        return handler
+
+    has_before = _overrides(middleware, 'before')
+    has_after = _overrides(middleware, 'after')
+    before = middleware.before
+    after = middleware.after
+
+    if has_before and has_after:
+        async def handler(request):
+            response = before(request)
+            if response is None:
+                response = await call_next(request)
+            return after(request, response)
+    elif has_before:
+        async def handler(request):
+            response = before(request)
+            if response is None:
+                response = await call_next(request)
+            return response
+    elif has_after:
+        async def handler(request):
+            return after(request, await call_next(request))
+    else:
+        handler = call_next
+    return handler
+
+
+def build_chain(middlewares, handler):
+    """
+    Compile middlewares into a single callable at startup.
+    The first middleware is the outermost one
+    """
+    for middleware in reversed(middlewares):
+        handler = _compile(middleware, handler)
+    return handler
+
+
+def build_async_chain(middlewares, handler):
+    """build_chain for a coroutine function handler"""
+    for middleware in reversed(middlewares):
+        handler = _compile_async(middleware, handler)
+    return handler
+
+
+class FrontControllersMiddleware(Middleware):
+    """Run front controllers (callables mutating the request) for matched routes"""
+    def __init__(self, front_controllers):
+        self.front_controllers = tuple(front_controllers)
+
+    def before(self, request):
+        if request.route is not None:
+            for front in self.front_controllers:
+                front(request)
+
+
+class ResponseCacheMiddleware(Middleware):
+    """Serve GET/HEAD of routes with a CachePolicy from ResponseCache"""
+    CACHEABLE_METHODS = ('GET', 'HEAD')
+
+    def __init__(self, cache):
+        self.cache = cache
+
+    def __call__(self, request, call_next):
+        route = request.route
+        if route is None or route.cache is None or request.method not in self.CACHEABLE_METHODS:
+            return call_next(request)
+
+        key = self.cache.make_key(request.environ, route.cache)
+        response = self.cache.get_response(key)
+        if response is None:
+            generation = self.cache.generation(route.cache)
+            response = self.cache.store_response(key, call_next(request), route.cache, generation)
+        return response
+
+    async def acall(self, request, call_next):
+        route = request.route
+        if route is None or route.cache is None or request.method not in self.CACHEABLE_METHODS:
+            return await call_next(request)
+
+        key = self.cache.make_key(request.environ, route.cache)
+        response = await run_sync(self.cache.get_response, key)
+        if response is None:
+            generation = await run_sync(self.cache.generation, route.cache)
+            response = await call_next(request)
+            response = await run_sync(self.cache.store_response, key, response, route.cache, generation)
+        return response
+
+
+class ConditionalGetMiddleware(Middleware):
+    """Answer 304 Not Modified when the client copy is current"""
+    def after(self, request, response):
+        return conditional_response(request.environ, response)
+
+
+class CompressionMiddleware(Middleware):
+    """Compress responses with framework.compression.Compressor"""
+    def __init__(self, compressor):
+        self.compressor = compressor
+
+    def after(self, request, response):
+        return self.compressor.compress(request.environ, response)
+
+
+class TimingMiddleware(Middleware):
+    """Add Server-Timing header with the time spent in the inner handlers"""
+    def __init__(self, name='app'):
+        self.name = name
+
+    def __call__(self, request, call_next):
+        start = time.perf_counter()
+        response = call_next(request)
+        duration = (time.perf_counter() - start) * 1000
+        response.headers.append(('Server-Timing', f'{self.name};dur={duration:.2f}'))
+        return response
+
+    async def acall(self, request, call_next):
+        start = time.perf_counter()
+        response = await call_next(request)
+        duration = (time.perf_counter() - start) * 1000
+        response.headers.append(('Server-Timing', f'{self.name};dur={duration:.2f}'))
+        return response
@@ -0,0 +1,167 @@
+from http.cookies import CookieError, SimpleCookie
+from urllib.parse import parse_qsl
+
+from framework.body import is_form, parse_form, parse_json, read_body
+from framework.utils import MultiDict
+
+
+_MISSING = object()
+
+
+class Request:
+    """
+    HTTP request.
+    query, form, cookies and headers are parsed on first access and cached,
+    so handlers which never read them don't pay for parsing.
+    Item access (request['data'], request['id']) is kept for controllers
+    written against the request dict: 'method', 'data', 'environ' and
+    'route' map to attributes, other keys to route params and values set
+    by middlewares.
+    """
+    __slots__ = ('environ', 'method', 'path', 'route', 'context', 'session_loader',
+                 '_session', '_query', '_form', '_files', '_body', '_json', '_data', '_cookies', '_headers')
+
+    _ATTRIBUTES = frozenset(('method', 'data', 'environ', 'route'))
+
+    def __init__(self, environ, route=None, params=None):
+        self.environ = environ
+        self.method = environ['REQUEST_METHOD']
+        self.path = environ['PATH_INFO']
+        self.route = route
+        # route params and values of middlewares
+        self.context = params if params is not None else {}
+        # set by SessionMiddleware, called on first access to session
+        self.session_loader = None
+        self._session = None
+        self._query = None
+        self._form = None
+        self._files = None
+        self._body = None
+        self._json = _MISSING
+        self._data = None
+        self._cookies = None
+        self._headers = None
+
+    @property
+    def query(self) -> MultiDict:
+        """Query string params"""
+        if self._query is None:
+            self._query = MultiDict(parse_qsl(self.environ.get('QUERY_STRING', ''), keep_blank_values=True))
+        return self._query
+
+    @property
+    def form(self) -> MultiDict:
+        """Text fields of urlencoded or multipart body"""
+        if self._form is None:
+            if self.method in ('GET', 'HEAD'):
+                self._form, self._files = MultiDict(), MultiDict()
+            else:
+                self._form, self._files = parse_form(self.environ)
+                if is_form(self.environ):
+                    # wsgi.input was read by the parser
+                    self._body = b''
+        return self._form
+
+    @property
+    def files(self) -> MultiDict:
+        """UploadedFile fields of multipart body"""
+        if self._files is None:
+            self.form
+        return self._files
+
+    @property
+    def body(self) -> bytes:
+        """Raw body, empty if it was already consumed by form parsing"""
+        if self._body is None:
+            self._body = read_body(self.environ)
+        return self._body
+
+    @property
+    def json(self):
+        """Decoded JSON body or None"""
+        if self._json is _MISSING:
+            self._json = parse_json(self.body)
+        return self._json
+
+    @property
+    def data(self) -> MultiDict:
+        """Query params of GET/HEAD and form fields of POST requests"""
+        if self._data is None:
+            if self.method in ('GET', 'HEAD'):
+                self._data = self.query
+            elif self.method == 'POST':
+                self._data = self.form
+            else:
+                self._data = MultiDict()
+        return self._data
+
+    @data.setter
+    def data(self, value):
+        self._data = value
+
+    @property
+    def cookies(self) -> dict:
+        if self._cookies is None:
+            cookie = SimpleCookie()
+            try:
+                cookie.load(self.environ.get('HTTP_COOKIE', ''))
+            except CookieError:
+                pass
+            self._cookies = {name: morsel.value for name, morsel in cookie.items()}
+        return self._cookies
+
+    @property
+    def headers(self) -> dict:
+        """Request headers with lower-case names"""
+        if self._headers is None:
+            headers = {}
+            for key, value in self.environ.items():
+                if key.startswith('HTTP_'):
+                    headers[key[5:].replace('_', '-').lower()] = value
+                elif key in ('CONTENT_TYPE', 'CONTENT_LENGTH') and value:
+                    headers[key.replace('_', '-').lower()] = value
+            self._headers = headers
+        return self._headers
+
+    @property
+    def session(self):
+        """Session loaded on first access"""
+        if self._session is None:
+            if self.session_loader is None:
+                raise AttributeError('request.session requires SessionMiddleware')
+            self._session = self.session_loader(self)
+        return self._session
+
+    def get_loaded_session(self):
+        """Session if it was accessed during the request, otherwise None"""
+        return self._session
+
+    def get_header(self, name, default=None):
+        """Single header without building the headers dict"""
+        key = name.upper().replace('-', '_')
+        if key not in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            key = f'HTTP_{key}'
+        return self.environ.get(key, default)
+
+    def __getitem__(self, key):
+        if key in self._ATTRIBUTES:
+            return getattr(self, key)
+        return self.context[key]
+
+    def __setitem__(self, key, value):
+        if key in self._ATTRIBUTES:
+            setattr(self, key, value)
+        else:
+            self.context[key] = value
+
+    def __contains__(self, key):
+        return key in self._ATTRIBUTES or key in self.context
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self):
+        return f'<Request {self.method} {self.path}>'
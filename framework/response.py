@@ -0,0 +1,111 @@
+from http.cookies import SimpleCookie
+
+
+class Response:
+    """
+    HTTP response.
+    body may be bytes, str or an iterable of bytes/str chunks (e.g. a
+    template stream), Content-Length is sent only when the size is known.
+    """
+    def __init__(self, body=b'', status='200 OK', headers=None,
+                 content_type='text/html', charset='utf-8'):
+        self.body = body
+        self.status = status
+        self.headers = list(headers or [])
+        self.content_type = content_type
+        self.charset = charset
+        self.cookies = SimpleCookie()
+
+    @classmethod
+    def from_result(cls, result):
+        """Build Response from controller result: Response or (status, body) tuple"""
+        if isinstance(result, Response):
+            return result
+        status, body = result
+        return cls(body, status)
+
+    @property
+    def status_code(self) -> int:
+        return int(self.status.split(' ', 1)[0])
+
+    def set_header(self, name, value):
+        """Replace all headers with the name"""
+        self.delete_header(name)
+        self.headers.append((name, value))
+
+    def get_header(self, name, default=None):
+        name = name.lower()
+        for key, value in self.headers:
+            if key.lower() == name:
+                return value
+        return default
+
+    def delete_header(self, name):
+        name = name.lower()
+        self.headers = [(key, value) for key, value in self.headers if key.lower() != name]
+
+    def add_vary(self, name):
+        """Add the request header name to Vary"""
+        vary = self.get_header('Vary')
+        if vary is None:
+            self.set_header('Vary', name)
+        elif name.lower() not in (item.strip().lower() for item in vary.split(',')):
+            self.set_header('Vary', f'{vary}, {name}')
+
+    def set_cookie(self, name, value, max_age=None, path='/', domain=None,
+                   secure=False, httponly=True, samesite='Lax'):
+        self.cookies[name] = value
+        morsel = self.cookies[name]
+        morsel['path'] = path
+        if max_age is not None:
+            morsel['max-age'] = max_age
+        if domain:
+            morsel['domain'] = domain
+        morsel['secure'] = secure
+        morsel['httponly'] = httponly
+        if samesite:
+            morsel['samesite'] = samesite
+
+    def delete_cookie(self, name, path='/', domain=None):
+        self.set_cookie(name, '', max_age=0, path=path, domain=domain)
+
+    @property
+    def is_streaming(self) -> bool:
+        return not isinstance(self.body, (bytes, str, list, tuple))
+
+    def content_length(self):
+        """Body size in bytes or None for streaming bodies"""
+        if self.is_streaming:
+            return None
+        if isinstance(self.body, str):
+            self.body = self.body.encode(self.charset)
+        if isinstance(self.body, bytes):
+            return len(self.body)
+        self.body = [self._encode(chunk) for chunk in self.body]
+        return sum(len(chunk) for chunk in self.body)
+
+    def wsgi_headers(self) -> list:
+        headers = []
+        if self.content_type and self.get_header('Content-Type') is None:
+            content_type = self.content_type
+            if self.charset and content_type.startswith('text/'):
+                content_type = f'{content_type}; charset={self.charset}'
+            headers.append(('Content-Type', content_type))
+        length = self.content_length()
+        if length is not None and self.status_code not in (204, 304) \
+                and self.get_header('Content-Length') is None:
+            headers.append(('Content-Length', str(length)))
+        headers.extend(self.headers)
+        headers.extend(('Set-Cookie', morsel.OutputString()) for morsel in self.cookies.values())
+        return headers
+
+    def iter_body(self):
+        """Iterable of bytes chunks for the WSGI server"""
+        if isinstance(self.body, bytes):
+            return [self.body]
+        if isinstance(self.body, str):
+            return [self.body.encode(self.charset)]
+        return (self._encode(chunk) for chunk in self.body)
+
+    def _encode(self, chunk):
+        return chunk.encode(self.charset) if isinstance(chunk, str) else chunk
@@ -0,0 +1,165 @@
+import re
+
+
+class RouteException(Exception):
+    def __init__(self, args):
+        super().__init__(f'Invalid route: {args}')
+
+
+class IntConverter:
+    """<int:name> - non-negative integer"""
+    regex = re.compile(r'\d+')
+    to_python = int
+
+
+class StrConverter:
+    """<str:name> or <name> - one path segment"""
+    regex = re.compile(r'[^/]+')
+    to_python = str
+
+
+class SlugConverter:
+    """<slug:name> - letters, digits, hyphens and underscores"""
+    regex = re.compile(r'[-\w]+')
+    to_python = str
+
+
+CONVERTERS = {
+    'int': IntConverter,
+    'str': StrConverter,
+    'slug': SlugConverter,
+}
+
+PARAM_RE = re.compile(r'^<(?:(?P<converter>\w+):)?(?P<name>\w+)>$')
+
+
+def normalize_path(path):
+    """Add slash to the end of URL if necessary"""
+    if not path.endswith('/'):
+        path = f'{path}/'
+    return path
+
+
+class Route:
+    """Route pattern with method -> controller class table"""
+    def __init__(self, pattern, cache=None):
+        self.pattern = pattern
+        self.controllers = {}
+        self.cache = cache
+
+    @property
+    def methods(self):
+        return tuple(self.controllers)
+
+    def add(self, controller, methods):
+        for method in methods:
+            self.controllers[method.upper()] = controller
+        # HEAD is answered by the GET handler unless registered explicitly
+        if 'GET' in self.controllers:
+            self.controllers.setdefault('HEAD', self.controllers['GET'])
+
+
+class _Node:
+    __slots__ = ('static', 'params', 'route')
+
+    def __init__(self):
+        self.static = {}
+        self.params = []
+        self.route = None
+
+
+class Router:
+    """
+    URL router built at registration time.
+    Static URLs are resolved with a single dict lookup, URLs with
+    parameters (e.g. /courses/<int:id>/update/) by walking a segment trie.
+    """
+    def __init__(self):
+        self.static = {}
+        self.routes = {}
+        self._root = _Node()
+
+    def add(self, pattern, controller, methods=('GET',), cache=None):
+        pattern = normalize_path(pattern)
+        route = self.routes.get(pattern)
+        if route is None:
+            route = self.routes[pattern] = Route(pattern, cache)
+            segments = self._split(pattern)
+            if any(segment.startswith('<') for segment in segments):
+                self._insert(segments, route)
+            else:
+                self.static[pattern] = route
+        route.add(controller, methods)
+        if cache is not None:
+            route.cache = cache
+        return route
+
+    def match(self, path):
+        """Return (route, params) for the path or (None, None)"""
+        path = normalize_path(path)
+        route = self.static.get(path)
+        if route is not None:
+            return route, {}
+
+        params = {}
+        route = self._walk(self._root, self._split(path), 0, params)
+        if route is None:
+            return None, None
+        return route, params
+
+    def dump(self):
+        """Route table as a list of (pattern, methods, controller) tuples"""
+        return [
+            (route.pattern, route.methods, route.controllers[route.methods[0]].__name__)
+            for route in self.routes.values()
+        ]
+
+    @staticmethod
+    def _split(path):
+        return [segment for segment in path.split('/') if segment]
+
+    def _insert(self, segments, route):
+        node = self._root
+        for segment in segments:
+            param = PARAM_RE.match(segment)
+            if param is None:
+                if segment.startswith('<'):
+                    raise RouteException(route.pattern)
+                node = node.static.setdefault(segment, _Node())
+                continue
+
+            converter_name = param['converter'] or 'str'
+            if converter_name not in CONVERTERS:
+                raise RouteException(f'{route.pattern} - unknown converter {converter_name}')
+            converter = CONVERTERS[converter_name]
+            for name, conv, child in node.params:
+                if name == param['name'] and conv is converter:
+                    node = child
+                    break
+            else:
+                child = _Node()
+                node.params.append((param['name'], converter, child))
+                node = child
+
+        if node.route is not None and node.route is not route:
+            raise RouteException(f'{route.pattern} - conflicts with {node.route.pattern}')
+        node.route = route
+
+    def _walk(self, node, segments, index, params):
+        if index == len(segments):
+            return node.route
+
+        segment = segments[index]
+        child = node.static.get(segment)
+        if child is not None:
+            route = self._walk(child, segments, index + 1, params)
+            if route is not None:
+                return route
+
+        for name, converter, child in node.params:
+            if converter.regex.fullmatch(segment):
+                route = self._walk(child, segments, index + 1, params)
+                if route is not None:
+                    params[name] = converter.to_python(segment)
+                    return route
+        return None
@@ -0,0 +1,261 @@
+import json
+import secrets
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from framework.executor import run_sync
+from framework.middleware import Middleware
+from framework.signing import b64decode, b64encode, sign, unsign
+
+
+SESSION_COOKIE_NAME = 'sessionid'
+SESSION_MAX_AGE = 14 * 24 * 3600
+
+# Browsers drop cookies larger than 4 KB
+MAX_COOKIE_SIZE = 4093
+
+_SALT = 'session'
+
+
+class SessionException(Exception):
+    def __init__(self, args):
+        super().__init__(f'Session error: {args}')
+
+
+class Session(dict):
+    """
+    Session data, modified is set by item assignment and deletion.
+    Set modified = True after changing a nested value in place
+    """
+    def __init__(self, data=None, cookie=None):
+        super().__init__(data or {})
+        self.cookie = cookie
+        self.modified = False
+
+    def __setitem__(self, key, value):
+        super().__setitem__(key, value)
+        self.modified = True
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self.modified = True
+
+    def pop(self, key, *default):
+        self.modified = self.modified or key in self
+        return super().pop(key, *default)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.modified = True
+        return super().setdefault(key, default)
+
+    def update(self, *args, **kwargs):
+        super().update(*args, **kwargs)
+        self.modified = True
+
+    def clear(self):
+        self.modified = self.modified or bool(self)
+        super().clear()
+
+
+class SignedCookieSessionBackend:
+    """Session data in the cookie itself: JSON with expiry time signed with HMAC"""
+    def load(self, cookie):
+        value = unsign(cookie, _SALT)
+        if value is None:
+            return None
+        try:
+            expires_at, data = json.loads(b64decode(value))
+        except ValueError:
+            return None
+        return data if expires_at > time.time() else None
+
+    def save(self, cookie, data, max_age) -> str:
+        payload = json.dumps([time.time() + max_age, data], separators=(',', ':')).encode()
+        cookie = sign(b64encode(payload), _SALT)
+        if len(cookie) > MAX_COOKIE_SIZE:
+            raise SessionException(f'cookie size {len(cookie)} exceeds {MAX_COOKIE_SIZE} bytes')
+        return cookie
+
+    def delete(self, cookie):
+        pass
+
+
+class SqliteSessionBackend:
+    """
+    Server-side sessions in a SQLite file, the cookie holds a signed key.
+    Loaded sessions are kept in a per-process LRU of cache_size entries for
+    cache_ttl seconds, so writes of other workers are seen after cache_ttl
+    """
+    # expired rows are deleted every cleanup_every saves
+    cleanup_every = 1000
+
+    def __init__(self, database='sessions.sqlite', cache_size=1024, cache_ttl=5, busy_timeout=5000):
+        self.database = database
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.busy_timeout = busy_timeout
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._saves = 0
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS sessions ('
+            'session_key TEXT PRIMARY KEY NOT NULL, data TEXT NOT NULL, expires_at REAL NOT NULL)')
+        connection.commit()
+
+    def load(self, cookie):
+        key = unsign(cookie, _SALT)
+        if key is None:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is not None:
+                cached_until, expires_at, data = entry
+                if cached_until > now and expires_at > now:
+                    self._cache.move_to_end(key)
+                    return json.loads(data)
+                del self._cache[key]
+
+        row = self._connection().execute(
+            'SELECT data, expires_at FROM sessions WHERE session_key=? AND expires_at>?', (key, now)
+        ).fetchone()
+        if row is None:
+            return None
+        self._cache_set(key, row[1], row[0])
+        return json.loads(row[0])
+
+    def save(self, cookie, data, max_age) -> str:
+        key = unsign(cookie, _SALT) if cookie else None
+        if key is None:
+            key = secrets.token_urlsafe(32)
+        expires_at = time.time() + max_age
+        data = json.dumps(data, separators=(',', ':'))
+        connection = self._connection()
+        with connection:
+            connection.execute(
+                'INSERT OR REPLACE INTO sessions (session_key, data, expires_at) VALUES (?, ?, ?)',
+                (key, data, expires_at))
+        self._cache_set(key, expires_at, data)
+
+        self._saves += 1
+        if self._saves % self.cleanup_every == 0:
+            self.cleanup()
+        return sign(key, _SALT)
+
+    def delete(self, cookie):
+        key = unsign(cookie, _SALT)
+        if key is None:
+            return
+        with self._lock:
+            self._cache.pop(key, None)
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM sessions WHERE session_key=?', (key, ))
+
+    def cleanup(self):
+        """Delete expired sessions"""
+        connection = self._connection()
+        with connection:
+            connection.execute('DELETE FROM sessions WHERE expires_at<=?', (time.time(), ))
+
+    def _cache_set(self, key, expires_at, data):
+        if not self.cache_size:
+            return
+        with self._lock:
+            self._cache[key] = (time.time() + self.cache_ttl, expires_at, data)
+            self._cache.move_to_end(key)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+        return connection
+
+
+class SessionMiddleware(Middleware):
+    """
+    request.session backed by a pluggable backend (load/save/delete).
+    The session is loaded on first access to request.session and saved
+    only when it was modified. stats() reports load and save counts and
+    time for benchmarking. On ASGI async routes the session is loaded
+    before the controller and saved in the executor, so backend I/O
+    doesn't block the event loop
+    """
+    def __init__(self, backend=None, cookie_name=SESSION_COOKIE_NAME, max_age=SESSION_MAX_AGE, secure=False):
+        self.backend = backend if backend is not None else SignedCookieSessionBackend()
+        self.cookie_name = cookie_name
+        self.max_age = max_age
+        self.secure = secure
+        self.loads = 0
+        self.saves = 0
+        self.load_time = 0.0
+        self.save_time = 0.0
+        self._lock = threading.Lock()
+
+    def before(self, request):
+        request.session_loader = self.load
+
+    async def acall(self, request, call_next):
+        request.session_loader = self.load
+        if request.cookies.get(self.cookie_name):
+            # request.session is a sync property: read the backend in the
+            # executor in advance, the session still counts as accessed
+            # only when the controller reads request.session
+            session = await run_sync(self.load, request)
+            request.session_loader = lambda request: session
+        response = await call_next(request)
+        if request.get_loaded_session() is None:
+            return response
+        return await run_sync(self.after, request, response)
+
+    def after(self, request, response):
+        session = request.get_loaded_session()
+        if session is None:
+            return response
+        # the response depends on the session: keep it out of shared caches
+        response.set_header('Cache-Control', 'private, no-cache')
+        response.add_vary('Cookie')
+        if not session.modified:
+            return response
+
+        start = time.perf_counter()
+        if session:
+            cookie = self.backend.save(session.cookie, dict(session), self.max_age)
+            response.set_cookie(self.cookie_name, cookie, max_age=self.max_age, secure=self.secure)
+        elif session.cookie:
+            self.backend.delete(session.cookie)
+            response.delete_cookie(self.cookie_name)
+        duration = time.perf_counter() - start
+        with self._lock:
+            self.saves += 1
+            self.save_time += duration
+        return response
+
+    def load(self, request) -> Session:
+        start = time.perf_counter()
+        cookie = request.cookies.get(self.cookie_name)
+        data = self.backend.load(cookie) if cookie else None
+        session = Session(data, cookie if data is not None else None)
+        duration = time.perf_counter() - start
+        with self._lock:
+            self.loads += 1
+            self.load_time += duration
+        return session
+
+    def stats(self) -> dict:
+        return {
+            'loads': self.loads,
+            'saves': self.saves,
+            'avg_load_ms': round(self.load_time * 1000 / self.loads, 3) if self.loads else 0.0,
+            'avg_save_ms': round(self.save_time * 1000 / self.saves, 3) if self.saves else 0.0,
+        }
@@ -0,0 +1,38 @@
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+
+
+# Key for signed cookies. Set SECRET_KEY in the environment when running
+# several workers: the random fallback differs from process to process
+SECRET_KEY = os.environ.get('SECRET_KEY') or secrets.token_hex(32)
+
+
+def b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b'=').decode('ascii')
+
+
+def b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def signature(value: str, salt='', key=None) -> str:
+    """HMAC-SHA256 of the value, salt separates signatures of different purposes"""
+    key = (key or SECRET_KEY).encode()
+    return b64encode(hmac.new(key, f'{salt}:{value}'.encode(), hashlib.sha256).digest())
+
+
+def sign(value: str, salt='', key=None) -> str:
+    return f'{value}.{signature(value, salt, key)}'
+
+
+def unsign(signed, salt='', key=None):
+    """Value of a signed string or None if the signature is wrong"""
+    if not signed:
+        return None
+    value, _, sig = signed.rpartition('.')
+    if not value or not hmac.compare_digest(sig, signature(value, salt, key)):
+        return None
+    return value
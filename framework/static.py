@@ -0,0 +1,205 @@
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from framework.conditional import http_date, is_not_modified
+
+
+# Size of blocks read from a file when the server has no wsgi.file_wrapper
+BLOCK_SIZE = 64 * 1024
+
+# Cache-Control max-age for plain and content-hashed file names
+MAX_AGE = 3600
+HASHED_MAX_AGE = 365 * 24 * 3600
+
+HASHED_NAME_RE = re.compile(r'^(?P<name>.+)\.(?P<hash>[0-9a-f]{12})(?P<ext>\.[^./]+)$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class StaticFile:
+    """Metadata of a static file"""
+    __slots__ = ('path', 'size', 'mtime', 'etag', 'content_type', 'last_modified', 'content_hash')
+
+    def __init__(self, path, stat):
+        self.path = path
+        self.size = stat.st_size
+        self.mtime = int(stat.st_mtime)
+        self.etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        content_type, encoding = mimetypes.guess_type(path)
+        content_type = content_type or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type = f'{content_type}; charset=utf-8'
+        self.content_type = content_type
+        self.last_modified = http_date(self.mtime)
+        self.content_hash = None
+
+
+class StaticFiles:
+    """
+    Serve files from directory under url prefix.
+    Uses wsgi.file_wrapper (sendfile) for whole files, supports single
+    Range requests and conditional GET. File metadata is cached in an LRU
+    of cache_size entries, with auto_reload files are re-checked on every
+    request. url() returns content-hashed names (css/site.0123456789ab.css)
+    which are served with a long-lived immutable Cache-Control. A name with
+    a hash that doesn't match the current content (an old URL after a
+    deploy) gets the current file with the plain max_age.
+    """
+    def __init__(self, directory='static', prefix='/static/', cache_size=1024, auto_reload=False,
+                 max_age=MAX_AGE, hashed_max_age=HASHED_MAX_AGE):
+        self.directory = os.path.realpath(directory)
+        self.prefix = prefix
+        self.cache_size = cache_size
+        self.auto_reload = auto_reload
+        self.max_age = max_age
+        self.hashed_max_age = hashed_max_age
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+
+    def url(self, path) -> str:
+        """URL of the file with content hash in its name"""
+        static_file = self.get_file(path)
+        if static_file is None:
+            return f'{self.prefix}{path}'
+        name, ext = os.path.splitext(path)
+        return f'{self.prefix}{name}.{self.get_content_hash(static_file)}{ext}'
+
+    @staticmethod
+    def get_content_hash(static_file) -> str:
+        """Hash of the file content used in url(), computed once per file version"""
+        if static_file.content_hash is None:
+            digest = hashlib.blake2b(digest_size=6)
+            with open(static_file.path, 'rb') as f:
+                for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+                    digest.update(block)
+            static_file.content_hash = digest.hexdigest()
+        return static_file.content_hash
+
+    def get_file(self, path):
+        """StaticFile for the path relative to directory or None"""
+        with self._lock:
+            static_file = self._files.get(path)
+            if static_file is not None and not self.auto_reload:
+                self._files.move_to_end(path)
+                return static_file
+
+        full_path = os.path.realpath(os.path.join(self.directory, path))
+        if os.path.commonpath([full_path, self.directory]) != self.directory:
+            return None
+        try:
+            stat = os.stat(full_path)
+        except OSError:
+            return None
+        if not os.path.isfile(full_path):
+            return None
+        if static_file is not None and static_file.etag == StaticFile(full_path, stat).etag:
+            return static_file
+
+        static_file = StaticFile(full_path, stat)
+        with self._lock:
+            self._files[path] = static_file
+            self._files.move_to_end(path)
+            if len(self._files) > self.cache_size:
+                self._files.popitem(last=False)
+        return static_file
+
+    def __call__(self, environ, start_response):
+        """WSGI app, returns None when there is no such file"""
+        path = environ['PATH_INFO'][len(self.prefix):]
+        hashed = False
+        static_file = None
+
+        match = HASHED_NAME_RE.match(path)
+        if match:
+            static_file = self.get_file(f'{match["name"]}{match["ext"]}')
+            hashed = static_file is not None and match['hash'] == self.get_content_hash(static_file)
+        if static_file is None:
+            static_file = self.get_file(path)
+        if static_file is None:
+            return None
+
+        method = environ['REQUEST_METHOD']
+        if method not in ('GET', 'HEAD'):
+            start_response('405 Method Not Allowed', [('Allow', 'GET, HEAD'), ('Content-Length', '0')])
+            return [b'']
+
+        max_age = self.hashed_max_age if hashed else self.max_age
+        cache_control = f'public, max-age={max_age}' + (', immutable' if hashed else '')
+        headers = [
+            ('ETag', static_file.etag),
+            ('Last-Modified', static_file.last_modified),
+            ('Cache-Control', cache_control),
+            ('Accept-Ranges', 'bytes'),
+        ]
+        if is_not_modified(environ, static_file.etag, static_file.mtime):
+            start_response('304 Not Modified', headers)
+            return [b'']
+
+        byte_range = self._get_range(environ, static_file)
+        if byte_range == 'invalid':
+            start_response('416 Range Not Satisfiable',
+                           headers + [('Content-Range', f'bytes */{static_file.size}'), ('Content-Length', '0')])
+            return [b'']
+
+        headers.append(('Content-Type', static_file.content_type))
+        if byte_range is None:
+            start, end = 0, static_file.size - 1
+            status = '200 OK'
+        else:
+            start, end = byte_range
+            status = '206 Partial Content'
+            headers.append(('Content-Range', f'bytes {start}-{end}/{static_file.size}'))
+        length = end - start + 1 if static_file.size else 0
+        headers.append(('Content-Length', str(length)))
+
+        start_response(status, headers)
+        if method == 'HEAD':
+            return [b'']
+
+        f = open(static_file.path, 'rb')
+        if byte_range is None and 'wsgi.file_wrapper' in environ:
+            return environ['wsgi.file_wrapper'](f, BLOCK_SIZE)
+        f.seek(start)
+        return self._read(f, length)
+
+    @staticmethod
+    def _get_range(environ, static_file):
+        """(start, end) of a single Range, None for the whole file or 'invalid'"""
+        header = environ.get('HTTP_RANGE')
+        if not header or not static_file.size:
+            return None
+        if_range = environ.get('HTTP_IF_RANGE')
+        if if_range and if_range != static_file.etag and if_range != static_file.last_modified:
+            return None
+        match = RANGE_RE.match(header.strip())
+        if match is None:
+            # several ranges or another unit: send the whole file
+            return None
+
+        first, last = match.groups()
+        size = static_file.size
+        if not first and not last:
+            return None
+        if not first:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        if start >= size or start > end:
+            return 'invalid'
+        return start, end
+
+    @staticmethod
+    def _read(f, length):
+        try:
+            while length > 0:
+                block = f.read(min(BLOCK_SIZE, length))
+                if not block:
+                    break
+                length -= len(block)
+                yield block
+        finally:
+            f.close()
@@ -21,6 +21,14 @@ class NotFoundPage(BaseController):
         self.template_name = 'page404.html'
 
 
+class MethodNotAllowedPage(BaseController):
+    """Page405 Controller"""
+    def __init__(self):
+        super().__init__()
+        self.response = '405 Method Not Allowed'
+        self.template_name = 'page405.html'
+
+
 class PageController(BaseController):
     def __init__(self):
         super().__init__()
@@ -1,18 +1,131 @@
-from jinja2 import FileSystemLoader
+import hashlib
+import os
+import time
+
+from jinja2 import FileSystemBytecodeCache, FileSystemLoader
 from jinja2.environment import Environment
 
+from patterns.singleton import Singleton
+
 
 TEMPLATES = 'templates'
 
+# Number of compiled templates kept in memory (LRU, keyed by template name)
+TEMPLATES_CACHE_SIZE = 100
 
-def render(template_name, **kwargs):
-    env = Environment()
-    env.loader = FileSystemLoader(TEMPLATES)
-    template = env.get_template(template_name)
+# Check template file mtime on every lookup and recompile changed templates.
+# Set to False in production: compiled templates are then never re-checked.
+TEMPLATES_AUTO_RELOAD = True
+
+# Seconds the templates version (used in ETags) is reused with auto_reload on
+TEMPLATES_VERSION_TTL = 1.0
+
+# Directory for persisted template bytecode, None disables the disk cache
+TEMPLATES_BYTECODE_CACHE = None
+
+# Minimal size (in characters) of a chunk yielded by stream()
+STREAM_BUFFER_SIZE = 8192
+
+STATIC_URL = '/static/'
+
+
+def static_url(path):
+    """Default `static` template global, replaced by StaticFiles.url"""
+    return f'{STATIC_URL}{path}'
+
+
+def render_fragment(name, ttl=300, tags=(), caller=None):
+    """
+    Default `fragment` template global (call block without caching),
+    replaced by ResponseCache.template_fragment
+    """
+    return caller()
 
-    return template.render(**kwargs)
 
+class TemplateEngine(metaclass=Singleton):
+    """Process-wide jinja2 environment with compiled templates cache"""
+    def __init__(self, path=TEMPLATES, cache_size=TEMPLATES_CACHE_SIZE,
+                 auto_reload=TEMPLATES_AUTO_RELOAD, bytecode_cache=TEMPLATES_BYTECODE_CACHE):
+        bcc = None
+        if bytecode_cache:
+            os.makedirs(bytecode_cache, exist_ok=True)
+            bcc = FileSystemBytecodeCache(bytecode_cache)
+
+        # jinja2 keeps loaded templates in an LRU of `cache_size` entries and,
+        # with auto_reload, only reloads one when the loader reports its
+        # source file mtime has changed
+        self.env = Environment(
+            loader=FileSystemLoader(path),
+            cache_size=cache_size,
+            auto_reload=auto_reload,
+            bytecode_cache=bcc,
+        )
+        self.env.globals['static'] = static_url
+        self.env.globals['fragment'] = render_fragment
+        # the same loader and globals for `async def` controllers
+        self.async_env = self.env.overlay(enable_async=True)
+        self._version = None
+        self._version_expires = 0.0
+
+    @property
+    def version(self) -> str:
+        """
+        Hash of template names and modification times, used in ETags.
+        With auto_reload on it is recomputed every TEMPLATES_VERSION_TTL
+        seconds, otherwise computed once
+        """
+        now = time.monotonic()
+        if self._version is None or (self.env.auto_reload and now >= self._version_expires):
+            digest = hashlib.blake2b(digest_size=8)
+            for searchpath in self.env.loader.searchpath:
+                for template_name in self.env.loader.list_templates():
+                    path = os.path.join(searchpath, template_name)
+                    if os.path.exists(path):
+                        digest.update(f'{template_name}:{os.stat(path).st_mtime_ns};'.encode())
+            self._version = digest.hexdigest()
+            self._version_expires = now + TEMPLATES_VERSION_TTL
+        return self._version
+
+    def get_template(self, template_name):
+        return self.env.get_template(template_name)
+
+    def render(self, template_name, **kwargs):
+        return self.get_template(template_name).render(**kwargs)
+
+    async def render_async(self, template_name, **kwargs):
+        return await self.async_env.get_template(template_name).render_async(**kwargs)
+
+    def stream(self, template_name, buffer_size=STREAM_BUFFER_SIZE, **kwargs):
+        """Render template lazily, yielding chunks of at least buffer_size characters"""
+        buffer = []
+        size = 0
+        for chunk in self.get_template(template_name).generate(**kwargs):
+            buffer.append(chunk)
+            size += len(chunk)
+            if size >= buffer_size:
+                yield ''.join(buffer)
+                buffer = []
+                size = 0
+        if buffer:
+            yield ''.join(buffer)
+
+    def clear(self):
+        """Drop all compiled templates"""
+        for env in (self.env, self.async_env):
+            if env.cache is not None:
+                env.cache.clear()
+        if self.env.bytecode_cache is not None:
+            self.env.bytecode_cache.clear()
+        self._version = None
+
+
+def render(template_name, **kwargs):
+    return TemplateEngine().render(template_name, **kwargs)
 
 
+async def render_async(template_name, **kwargs):
+    return await TemplateEngine().render_async(template_name, **kwargs)
 
 
+def stream(template_name, **kwargs):
+    return TemplateEngine().stream(template_name, **kwargs)
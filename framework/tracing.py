@@ -0,0 +1,124 @@
+import contextvars
+import functools
+import inspect
+import itertools
+import json
+import os
+import sys
+import time
+
+
+OFF = 0
+REQUEST = 1
+CONTROLLER = 2
+METHOD = 3
+
+LEVELS = {
+    'OFF': OFF,
+    'REQUEST': REQUEST,
+    'CONTROLLER': CONTROLLER,
+    'METHOD': METHOD,
+}
+
+# Decorators read the level at import time: with OFF they return the
+# original functions, so disabled tracing costs nothing per call
+TRACE_LEVEL = LEVELS[os.environ.get('TRACE_LEVEL', 'OFF').upper()]
+
+
+def stderr_sink(record):
+    """Write span record as a JSON line to stderr"""
+    sys.stderr.write(json.dumps(record, ensure_ascii=False, default=str) + '\n')
+
+
+_sink = stderr_sink
+_current = contextvars.ContextVar('current_span', default=None)
+_ids = itertools.count(1)
+
+
+def enabled(level) -> bool:
+    return TRACE_LEVEL >= level
+
+
+def set_sink(sink):
+    """Set callable receiving span records (dicts)"""
+    global _sink
+    _sink = sink
+
+
+class Span:
+    """Timed span, the record is sent to the sink on exit"""
+    __slots__ = ('kind', 'name', 'attrs', 'span_id', 'parent_id', 'trace_id', '_start', '_token')
+
+    def __init__(self, kind, name, **attrs):
+        self.kind = kind
+        self.name = name
+        self.attrs = attrs
+
+    def __enter__(self):
+        parent = _current.get()
+        self.span_id = next(_ids)
+        self.parent_id = parent.span_id if parent else None
+        self.trace_id = parent.trace_id if parent else self.span_id
+        self._token = _current.set(self)
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._start
+        _current.reset(self._token)
+        record = {
+            'kind': self.kind,
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'duration_ms': round(duration * 1000, 3),
+        }
+        record.update(self.attrs)
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        _sink(record)
+        return False
+
+
+def traced(func, kind, name=None, level=METHOD):
+    """Wrap func into a span or return it unchanged when the level is disabled"""
+    if not enabled(level):
+        return func
+    name = name or func.__qualname__
+
+    if inspect.iscoroutinefunction(func):
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            with Span(kind, name):
+                return await func(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with Span(kind, name):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def trace_request(handle):
+    """Wrap Application.handle_request(request) into a request span"""
+    if not enabled(REQUEST):
+        return handle
+
+    if inspect.iscoroutinefunction(handle):
+        @functools.wraps(handle)
+        async def async_wrapper(request):
+            with Span('request', request.path, method=request.method) as span:
+                response = await handle(request)
+                span.attrs['status'] = response.status_code
+                return response
+        return async_wrapper
+
+    @functools.wraps(handle)
+    def wrapper(request):
+        with Span('request', request.path, method=request.method) as span:
+            response = handle(request)
+            span.attrs['status'] = response.status_code
+            return response
+    return wrapper
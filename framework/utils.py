@@ -1,28 +1,32 @@
-import datetime
-import json
+class MultiDict(dict):
+    """
+    dict of the last value of every key, getlist() returns all values.
+    Built from a sequence of (key, value) pairs
+    """
+    __slots__ = ('_lists',)
 
-from urllib.parse import unquote, unquote_plus
+    def __init__(self, pairs=()):
+        super().__init__()
+        self._lists = {}
+        for key, value in pairs:
+            self.add(key, value)
 
+    def add(self, key, value):
+        """Append value to the key"""
+        dict.__setitem__(self, key, value)
+        self._lists.setdefault(key, []).append(value)
 
-def parse_params(string: str):
-    """Parse param=value&... string"""
-    res = {}
-    if string:
-        pairs = string.split('&')
-        for item in pairs:
-            key, value = item.split('=')
-            res[key] = value
-    return res
+    def getlist(self, key) -> list:
+        return list(self._lists.get(key, ()))
 
+    def __setitem__(self, key, value):
+        dict.__setitem__(self, key, value)
+        self._lists[key] = [value]
+
+    def __delitem__(self, key):
+        dict.__delitem__(self, key)
+        self._lists.pop(key, None)
+
+    def lists(self):
+        return self._lists.items()
 
-def parse_post_data(environ):
-    """Parse POST data"""
-    data = environ['wsgi.input']
-    length = environ['CONTENT_LENGTH']
-    if data:
-        length = int(length) if length else 0
-        data = data.read(length).decode('utf-8')
-        data = unquote(data)
-        data = unquote_plus(data)
-        return parse_params(data)
-    return {}
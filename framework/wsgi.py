@@ -1,65 +1,115 @@
-import re
+import asyncio
+import inspect
 
-from controllers.front_controllers import AddSlash
-from framework.template_controllers import NotFoundPage
-from framework.utils import parse_params, parse_post_data
-from patterns.singleton import Singleton
+from framework import tracing
+from framework.context import iter_in_context, request_context
+from framework.body import RequestBodyException
+from framework.conditional import add_etag, is_not_modified, not_modified, set_validators
+from framework.middleware import FrontControllersMiddleware, build_chain
+from framework.request import Request
+from framework.response import Response
+from framework.router import Router
+from framework.template_controllers import NotFoundPage, MethodNotAllowedPage
+from framework.templator import TemplateEngine
 
 
 class Application:
-    routes = {}
+    router = Router()
 
-    def __init__(self, front_controllers=[]):
-        self.front_controllers = front_controllers
+    def __init__(self, front_controllers=(), middlewares=(), static=None):
+        """
+        middlewares - Middleware instances, the first one is the outermost.
+        front_controllers - legacy callables mutating the request, run
+        after middlewares for matched routes
+        """
+        middlewares = list(middlewares)
+        if front_controllers:
+            middlewares.append(FrontControllersMiddleware(front_controllers))
+        self.middlewares = tuple(middlewares)
+        self.static = static
+        if static is not None:
+            TemplateEngine().env.globals['static'] = static.url
+        self.handler = build_chain(self.middlewares, self.dispatch)
+        self.handle_request = tracing.trace_request(self.handle_request)
 
     def __call__(self, environ, start_response):
-        request = {}
-        data = {}
+        if self.static is not None and environ['PATH_INFO'].startswith(self.static.prefix):
+            result = self.static(environ, start_response)
+            if result is not None:
+                return result
 
-        # self.start_response = start_response
-        # self.environ = environ
-        print(environ)
-        method = environ['REQUEST_METHOD']
-        if method == 'GET':
-            data = parse_params(environ['QUERY_STRING'])
-        elif method == 'POST':
-            data = parse_post_data(environ)
+        response = self.handle(environ)
+        start_response(response.status, response.wsgi_headers())
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return [b'']
+        return response.iter_body()
 
-        request['method'] = method
-        request['data'] = data
+    def handle(self, environ):
+        """Route the request and return Response of the middleware chain"""
+        route, params = self.router.match(environ['PATH_INFO'])
+        return self.handle_request(Request(environ, route, params))
 
-        # Add slash to url
-        path = environ['PATH_INFO']
+    def handle_request(self, request):
+        with request_context(request):
+            try:
+                response = self.handler(request)
+            except RequestBodyException as e:
+                return Response(str(e), e.status, content_type='text/plain')
+        if response.is_streaming:
+            response.body = iter_in_context(request, response.body)
+        return response
 
-        id_ = re.search(r'\b\d+', path)
-        new_path = re.search(r'\D+\b', path)
-        path = re.search(r'\D+\b', path)[0] if new_path else '/'
-        add_slash = AddSlash()
-        path = add_slash(path)
+    def dispatch(self, request):
+        """
+        Call the controller of the matched route.
+        Routes keep controller classes, an instance is created per request
+        so controllers may keep request state in self
+        """
+        environ = request.environ
+        route = request.route
+        method = request.method
 
-        # print(self.routes)
-
-        if path in __class__.routes:
-            controller = __class__.routes[path]
-            if id_:
-                request.update({'id': id_[0]})
-            for front in self.front_controllers:
-                front(request)
-        else:
+        allow = None
+        if route is None:
             controller = NotFoundPage()
-        code, body = controller(request)
+        else:
+            controller_class = route.controllers.get(method)
+            if controller_class is None:
+                controller = MethodNotAllowedPage()
+                allow = ', '.join(route.methods)
+            else:
+                controller = controller_class()
+
+        # controllers may provide cheap validators (e.g. table versions)
+        # to answer 304 without rendering the page
+        etag = last_modified = None
+        if allow is None and method in ('GET', 'HEAD') and hasattr(controller, 'get_validators'):
+            etag, last_modified = controller.get_validators(request)
+            if is_not_modified(environ, etag, last_modified):
+                return not_modified(etag=etag, last_modified=last_modified)
 
-        start_response(code, [('Content-Type', 'text/html')])
-        return [body]
+        result = controller(request)
+        if inspect.isawaitable(result):
+            # async def controller outside of ASGIApplication
+            result = asyncio.run(result)
+        response = Response.from_result(result)
+        if allow:
+            response.set_header('Allow', allow)
+        set_validators(response, etag, last_modified)
+        return add_etag(environ, response)
 
     @classmethod
-    def route(cls, url):
+    def route(cls, url, methods=('GET',), cache=None):
+        """
+        Register controller class for the url.
+        cache - CachePolicy to serve GET responses from the response cache
+        """
         def decorator(cls_):
-            arg = re.search(r'\b\d+', url)
-            if arg:
-                cls.routes[url] = cls_(arg[0])
-            else:
-                cls.routes[url] = cls_()
-
+            cls.router.add(url, cls_, methods, cache)
             return cls_
         return decorator
+
+    @classmethod
+    def dump_routes(cls):
+        """Route table for benchmarking and debugging"""
+        return cls.router.dump()
@@ -1,15 +1,166 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime
 
+try:
+    import fcntl
+except ImportError:  # Windows: ротация без межпроцессной блокировки
+    fcntl = None
+
 from patterns.singleton import SingletonByName
 
 
 LOG_PATH = 'logs/'
 
+# Максимальное число записей, записываемых в файл за один раз
+LOG_BATCH_SIZE = 256
+
+# Ротация: по размеру файла (байт) и/или по времени (секунд), None - отключено
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_INTERVAL = None
+LOG_BACKUP_COUNT = 5
+
+_STOP = object()
+
 
 class Logger(metaclass=SingletonByName):
+    """
+    Логгер с фоновой записью: log() кладет запись в очередь,
+    поток-писатель пачками дописывает их в постоянно открытый файл.
+    Файл может писаться несколькими процессами (воркеры gunicorn):
+    ротацию выполняет один процесс под блокировкой файла .lock,
+    остальные переоткрывают файл, заметив смену inode
+    """
     def __init__(self, name):
         self.name = f'{name}'
+        self.path = f'{LOG_PATH}{self.name}'
+        self._queue = queue.SimpleQueue()
+        self._file = None
+        self._opened_at = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._start()
+        atexit.register(self.close)
 
     def log(self, data):
-        with open(f'{LOG_PATH}{self.name}', 'a+') as f:
-            f.write(f'{datetime.now()} - {data}\n')
+        if self._pid != os.getpid() or not self._thread.is_alive():
+            # после fork (gunicorn --preload) поток-писатель не наследуется
+            self._start()
+        self._queue.put(f'{datetime.now()} - {data}\n')
+
+    def flush(self, timeout=None):
+        """Дождаться записи всех поставленных в очередь записей"""
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def close(self, timeout=5):
+        """Записать остаток очереди и остановить поток-писатель"""
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread.is_alive():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name=f'logger-{self.name}', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            items = [self._queue.get()]
+            while len(items) < LOG_BATCH_SIZE:
+                try:
+                    items.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            lines = []
+            waiters = []
+            stop = False
+            for item in items:
+                if item is _STOP:
+                    stop = True
+                elif isinstance(item, threading.Event):
+                    waiters.append(item)
+                else:
+                    lines.append(item)
+
+            if lines:
+                try:
+                    self._write(''.join(lines))
+                except Exception as e:
+                    # запись теряется, но поток продолжает работу
+                    print(f'Ошибка записи журнала {self.path}: {e!r}')
+                    self._close_file()
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                self._close_file()
+                return
+
+    def _write(self, text):
+        if self._file is None or self._is_replaced():
+            self._open()
+        if self._need_rotation():
+            self._rotate()
+        self._file.write(text)
+        self._file.flush()
+
+    def _open(self):
+        self._close_file()
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self._file = open(self.path, 'a+')
+        self._opened_at = time.monotonic()
+
+    def _close_file(self):
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+
+    def _is_replaced(self):
+        """Файл переименован или удален (ротация в другом процессе)"""
+        try:
+            return os.stat(self.path).st_ino != os.fstat(self._file.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _need_rotation(self):
+        if LOG_MAX_BYTES and os.fstat(self._file.fileno()).st_size >= LOG_MAX_BYTES:
+            return True
+        return bool(LOG_ROTATE_INTERVAL) and time.monotonic() - self._opened_at >= LOG_ROTATE_INTERVAL
+
+    def _rotate(self):
+        with self._rotation_lock():
+            # другой процесс мог выполнить ротацию, пока мы ждали блокировку
+            if not self._is_replaced():
+                self._close_file()
+                for i in range(LOG_BACKUP_COUNT - 1, 0, -1):
+                    if os.path.exists(f'{self.path}.{i}'):
+                        os.replace(f'{self.path}.{i}', f'{self.path}.{i + 1}')
+                if LOG_BACKUP_COUNT:
+                    os.replace(self.path, f'{self.path}.1')
+                else:
+                    os.remove(self.path)
+            self._open()
+
+    @contextmanager
+    def _rotation_lock(self):
+        if fcntl is None:
+            yield
+            return
+        with open(f'{self.path}.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
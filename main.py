@@ -1,10 +1,56 @@
+from framework import executor
+from framework.asgi import ASGIApplication
+from framework.cache import ResponseCache, MemoryCacheBackend
+from framework.compression import Compressor
+from framework.csrf import CsrfMiddleware
+from framework.middleware import CompressionMiddleware, ConditionalGetMiddleware, ResponseCacheMiddleware
+from framework.session import SessionMiddleware, SignedCookieSessionBackend
+from framework.static import StaticFiles
+from framework.templator import TemplateEngine
 from framework.wsgi import Application
 from controllers.page_controllers import *
-from controllers.front_controllers import AddToken
+from controllers.front_controllers import NewIdentityMap, ReleaseConnection
+from create_db.migrate import migrate
+from models import data_mapper
+from models.models import DB_PATH, MapperRegistry, events, pool
+from models.outbox import OutboxWorker
 
 
-front_controllers = [
-    AddToken()
+migrate(DB_PATH)
+
+# для нескольких воркеров используйте SqliteCacheBackend('cache.sqlite'),
+# чтобы сброс кэша после записи был виден всем процессам
+response_cache = ResponseCache(MemoryCacheBackend())
+data_mapper.write_listeners.append(response_cache.invalidate_tags)
+# разметка списков без форм кэшируется и сбрасывается по тегам-таблицам
+TemplateEngine().env.globals['fragment'] = response_cache.template_fragment
+
+# уведомления об изменении курсов рассылаются фоновыми потоками из очереди outbox
+outbox_worker = OutboxWorker(lambda: MapperRegistry.get_mapper_by_name('Outbox'), events, pool.release)
+data_mapper.write_listeners.append(outbox_worker.on_write)
+outbox_worker.start()
+
+# данные сессии в подписанной cookie; для хранения на сервере -
+# SessionMiddleware(SqliteSessionBackend('sessions.sqlite'))
+session_middleware = SessionMiddleware(SignedCookieSessionBackend())
+
+# соединение с БД возвращается в пул после каждого запроса и каждого вызова run_sync
+executor.cleanup.append(pool.release)
+
+# первый в списке - внешний: сжатие видит итоговый ответ, кэш - ответ контроллера
+middlewares = [
+    ReleaseConnection(),
+    CompressionMiddleware(Compressor()),
+    ConditionalGetMiddleware(),
+    ResponseCacheMiddleware(response_cache),
+    CsrfMiddleware(),
+    session_middleware,
+    NewIdentityMap(),
 ]
 
-application = Application(front_controllers)
+static_files = StaticFiles('static', '/static/')
+
+application = Application(middlewares=middlewares, static=static_files)
+
+# uvicorn main:asgi_application
+asgi_application = ASGIApplication(middlewares=middlewares, static=static_files)
@@ -0,0 +1,135 @@
+import sqlite3
+import threading
+import time
+import weakref
+
+
+class PoolTimeoutException(Exception):
+    def __init__(self, args):
+        super().__init__(f'Нет свободного соединения с БД: {args}')
+
+
+# Число подготовленных выражений, кэшируемых sqlite3 в каждом соединении
+STATEMENT_CACHE_SIZE = 256
+
+# Настройки, применяемые к каждому новому соединению
+PRAGMAS = (
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-8000',
+)
+
+
+class ThreadConnection:
+    """
+    Соединение, закрепленное за потоком, и мапперы, созданные поверх него.
+    Соединение возвращается в пул вызовом ConnectionPool.release() (в конце
+    запроса) или когда поток завершается и объект удаляется вместе
+    с threading.local.
+    """
+    def __init__(self, pool, connection):
+        self.connection = connection
+        self.mappers = {}
+        self._finalizer = weakref.finalize(self, pool._put_back, connection)
+
+    def release(self):
+        self.mappers.clear()
+        self._finalizer()
+
+
+class ConnectionPool:
+    """
+    Пул соединений SQLite: одно соединение на поток, не более max_size
+    соединений на процесс. Поток, не получивший соединение, ждет
+    освобождения не дольше timeout секунд. Долгоживущие потоки (потоки
+    сервера, executor) должны вызывать release() после каждого запроса.
+    """
+    def __init__(self, database, max_size=16, timeout=30.0, busy_timeout=5000, pragmas=PRAGMAS):
+        self.database = database
+        self.max_size = max_size
+        self.timeout = timeout
+        self.busy_timeout = busy_timeout
+        self.pragmas = pragmas
+
+        self._local = threading.local()
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time = 0.0
+
+    def checkout(self) -> ThreadConnection:
+        """Вернуть соединение текущего потока, при необходимости взяв его из пула"""
+        thread_connection = getattr(self._local, 'connection', None)
+        if thread_connection is not None:
+            return thread_connection
+
+        connection = self._get()
+        thread_connection = ThreadConnection(self, connection)
+        self._local.connection = thread_connection
+        return thread_connection
+
+    def connection(self) -> sqlite3.Connection:
+        return self.checkout().connection
+
+    def release(self):
+        """Вернуть соединение текущего потока в пул"""
+        thread_connection = getattr(self._local, 'connection', None)
+        if thread_connection is not None:
+            self._local.connection = None
+            thread_connection.release()
+
+    def stats(self) -> dict:
+        """Статистика пула для мониторинга"""
+        with self._condition:
+            return {
+                'size': self._size,
+                'max_size': self.max_size,
+                'in_use': self._size - len(self._idle),
+                'idle': len(self._idle),
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'wait_time': self._wait_time,
+            }
+
+    def _get(self) -> sqlite3.Connection:
+        with self._condition:
+            self._checkouts += 1
+            if not self._idle and self._size >= self.max_size:
+                started = time.monotonic()
+                self._waits += 1
+                ready = self._condition.wait_for(
+                    lambda: self._idle or self._size < self.max_size, self.timeout)
+                self._wait_time += time.monotonic() - started
+                if not ready:
+                    raise PoolTimeoutException(f'{self.database}, max_size={self.max_size}')
+
+            if self._idle:
+                return self._idle.pop()
+            self._size += 1
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _put_back(self, connection):
+        if connection.in_transaction:
+            connection.rollback()
+        with self._condition:
+            self._idle.append(connection)
+            self._condition.notify()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.database, timeout=self.busy_timeout / 1000,
+                                     check_same_thread=False, cached_statements=STATEMENT_CACHE_SIZE)
+        connection.execute(f'PRAGMA busy_timeout={int(self.busy_timeout)}')
+        for pragma in self.pragmas:
+            connection.execute(pragma)
+        return connection
@@ -1,4 +1,17 @@
 import abc
+import threading
+from contextlib import contextmanager
+
+from models.identity_map import IdentityMap
+from models.query import Query
+
+
+# Максимальное число параметров в одном IN (...), меньше лимита SQLite
+IN_CHUNK_SIZE = 500
+
+# Размер страницы по умолчанию и число строк, читаемых за один fetchmany
+PAGE_SIZE = 50
+ITER_BATCH_SIZE = 500
 
 
 class RecordNotFoundException(Exception):
@@ -16,6 +29,80 @@ class MapperNotFoundException(Exception):
         super().__init__(f'Mapper не найден: {args}')
 
 
+class Page:
+    """
+    Страница объектов. after - идентификатор, после которого начинается
+    страница, next_after - то же для следующей страницы (None для последней)
+    """
+    def __init__(self, items, limit, after=None, next_after=None):
+        self.items = items
+        self.limit = limit
+        self.after = after
+        self.next_after = next_after
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+_transaction = threading.local()
+
+# Функции, вызываемые с именами измененных таблиц после фиксации изменений
+# (например, для сброса кэша страниц)
+write_listeners = []
+
+
+def _invalidate_cached():
+    """Сбросить строки кэшей, измененные транзакцией"""
+    invalidated = getattr(_transaction, 'invalidated', None)
+    if not invalidated:
+        return
+    _transaction.invalidated = []
+    for cache, id_ in invalidated:
+        cache.invalidate(id_)
+
+
+def _emit_writes():
+    _invalidate_cached()
+    tables = getattr(_transaction, 'tables', None)
+    if not tables:
+        return
+    _transaction.tables = set()
+    for listener in write_listeners:
+        listener(*tables)
+
+
+@contextmanager
+def transaction(connection):
+    """
+    Выполнить операции мапперов одной транзакцией.
+    Внутри блока commit мапперов не выполняется, изменения фиксируются
+    при выходе из внешнего блока или откатываются при исключении
+    """
+    depth = getattr(_transaction, 'depth', 0)
+    _transaction.depth = depth + 1
+    try:
+        yield connection
+    except Exception:
+        if not depth:
+            connection.rollback()
+            _transaction.tables = set()
+            _invalidate_cached()
+        raise
+    else:
+        if not depth:
+            try:
+                connection.commit()
+            except Exception as e:
+                raise DbCommitException(e.args)
+    finally:
+        _transaction.depth = depth
+    if not depth:
+        _emit_writes()
+
+
 class ClassMapper(metaclass=abc.ABCMeta):
     def __init__(self, connection):
         self.connection = connection
@@ -23,46 +110,158 @@ class ClassMapper(metaclass=abc.ABCMeta):
         self.mapped_class = None
         self.table_name = None
         self.id_name = None
+        self.columns = ()
+        # общий для процесса EntityCache строк таблицы или None
+        self.cache = None
+
+    def create(self, obj_):
+        """Вставить запись в таблицу"""
+        self.create_many([obj_])
 
-    @abc.abstractmethod
-    def create(self, *args, **kwargs):
-        pass
+    def create_many(self, objects):
+        """Вставить записи в таблицу одним executemany"""
+        columns = ', '.join(self.columns)
+        placeholders = ', '.join('?' * len(self.columns))
+        query = f'INSERT into {self.table_name} ({columns}) VALUES ({placeholders})'
+        self.cursor.executemany(query, [self.get_values(obj_) for obj_ in objects])
+        self.mark_written()
+        self.commit()
+
+    def load(self, item):
+        """
+        Объект по строке таблицы (первое поле - идентификатор).
+        Если объект с этим идентификатором уже загружен в текущем запросе,
+        возвращается он
+        """
+        identity_map = IdentityMap.get_current()
+        if identity_map is None:
+            return self.mapped_class(*item)
+        obj_ = identity_map.get(self.table_name, item[0])
+        if obj_ is None:
+            obj_ = self.mapped_class(*item)
+            identity_map.add(self.table_name, item[0], obj_)
+        return obj_
 
     def get_by_id(self, id_category: int):
         """Получить объект класса по идентификатору"""
-        query = f'SELECT * FROM {self.table_name} WHERE {self.id_name}=?'
-        self.cursor.execute(query, (id_category,))
-        result = self.cursor.fetchone()
+        identity_map = IdentityMap.get_current()
+        if identity_map is not None:
+            obj_ = identity_map.get(self.table_name, id_category)
+            if obj_ is not None:
+                return obj_
+
+        result = self.cache.get(id_category) if self.cache else None
+        if result is None:
+            version = self.cache.version if self.cache else None
+            query = f'SELECT * FROM {self.table_name} WHERE {self.id_name}=?'
+            self.cursor.execute(query, (id_category,))
+            result = self.cursor.fetchone()
+            if result and self.cache:
+                self.cache.set(id_category, result, version)
 
         if result:
-            return self.mapped_class(*result)
+            return self.load(result)
         else:
             raise RecordNotFoundException('Запись не найдена в базе данных')
 
+    def get_by_ids(self, ids) -> dict:
+        """
+        Получить словарь {идентификатор: объект}. Объекты, которых нет
+        в текущем запросе и в кэше, читаются запросом WHERE id IN (...)
+        на каждые IN_CHUNK_SIZE идентификаторов
+        """
+        identity_map = IdentityMap.get_current()
+        objects = {}
+        missing = []
+        for id_ in dict.fromkeys(ids):
+            obj_ = identity_map.get(self.table_name, id_) if identity_map else None
+            if obj_ is None and self.cache:
+                row = self.cache.get(id_)
+                obj_ = self.load(row) if row else None
+            if obj_ is None:
+                missing.append(id_)
+            else:
+                objects[id_] = obj_
+
+        version = self.cache.version if self.cache else None
+        for start in range(0, len(missing), IN_CHUNK_SIZE):
+            chunk = missing[start:start + IN_CHUNK_SIZE]
+            for item in self.query().where(self.id_name, 'in', chunk).execute():
+                if self.cache:
+                    self.cache.set(item[0], item, version)
+                objects[item[0]] = self.load(item)
+        return objects
+
+    def prefetch_related(self, objects, key, to_attr):
+        """
+        Загрузить связанные объекты этого маппера для списка objects
+        по внешнему ключу key и сохранить их в атрибут to_attr
+        (None, если запись не найдена)
+        """
+        related = self.get_by_ids(getattr(obj_, key) for obj_ in objects)
+        for obj_ in objects:
+            setattr(obj_, to_attr, related.get(getattr(obj_, key)))
+        return objects
+
+    def query(self) -> Query:
+        """Построитель параметризованного запроса к таблице маппера"""
+        return Query(self)
+
     def get_by_key(self, key, value) -> list:
         """Получить список объектов по значению ключа"""
-        query = f'SELECT * FROM {self.table_name} WHERE {key}={value}'
-        result = self.cursor.execute(query)
-
-        rows = []
-        if result:
-            for item in result:
-                rows.append(self.mapped_class(*item))
-            return rows
-        return []
+        return self.query().where(key, 'eq', value).all()
 
     def get_by_filter(self, filter_: dict) -> list:
-        """Получение списка объектов из БД, соответствующих фильтру {key: value, ...} """
-        query_string = ' AND '.join([f'{key}={value}' for key, value in filter_.items()])
-        query = f'SELECT * FROM {self.table_name} WHERE {query_string}'
-        result = self.cursor.execute(query)
+        """
+        Получение списка объектов из БД, соответствующих фильтру {key: value, ...}.
+        Ключ может содержать оператор: {'id_course__in': [1, 2]}
+        """
+        return self.query().filter(**filter_).all()
 
-        rows = []
-        if result:
-            for item in result:
-                rows.append(self.mapped_class(*item))
-            return rows
-        return []
+    def get_page(self, after=None, limit=PAGE_SIZE) -> Page:
+        """
+        Получить страницу объектов, упорядоченных по идентификатору,
+        начиная со следующего после after (keyset-пагинация)
+        """
+        query = self.query().order_by(self.id_name).limit(limit + 1)
+        if after is not None:
+            query.where(self.id_name, 'gt', after)
+        return self.make_page(query.all(), after, limit)
+
+    def make_page(self, rows, after, limit) -> Page:
+        """Страница из limit + 1 прочитанных объектов"""
+        next_after = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            next_after = getattr(rows[-1], self.id_name)
+        return Page(rows, limit, after, next_after)
+
+    def iter_all(self, batch_size=ITER_BATCH_SIZE):
+        """
+        Генератор объектов всех записей таблицы, строки читаются пачками fetchmany.
+        Объекты не регистрируются в IdentityMap, чтобы не держать в памяти всю таблицу
+        """
+        cursor = self.connection.cursor()
+        try:
+            cursor.execute(f'SELECT * FROM {self.table_name} ORDER BY {self.id_name}')
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for item in rows:
+                    yield self.mapped_class(*item)
+        finally:
+            cursor.close()
+
+    def get_versions(self, *table_names) -> tuple:
+        """
+        Версии и время последнего изменения (unix time) таблиц,
+        поддерживаемые триггерами (миграция 0002_table_versions)
+        """
+        table_names = table_names or (self.table_name, )
+        placeholders = ', '.join('?' * len(table_names))
+        query = f'SELECT table_name, version, updated_at FROM table_versions WHERE table_name IN ({placeholders})'
+        return tuple(sorted(self.cursor.execute(query, table_names)))
 
     def get_all(self):
         """Получение списка объектов, соответствующих всем записям таблицы"""
@@ -72,23 +271,69 @@ class ClassMapper(metaclass=abc.ABCMeta):
         rows = []
         if result:
             for item in result:
-                rows.append(self.mapped_class(*item))
+                rows.append(self.load(item))
             return rows
         return []
 
-    @abc.abstractmethod
-    def update(self, *args, **kwargs):
-        pass
+    def update(self, obj_):
+        """Обновить запись в БД"""
+        self.update_many([obj_])
+
+    def update_many(self, objects):
+        """Обновить записи в БД одним executemany"""
+        columns = ', '.join(f'{column}=?' for column in self.columns)
+        query = f'UPDATE {self.table_name} SET {columns} WHERE {self.id_name}=?'
+        self.cursor.executemany(
+            query, [(*self.get_values(obj_), getattr(obj_, self.id_name)) for obj_ in objects])
+        self.invalidate(objects)
+        self.mark_written()
+        self.commit()
 
     def delete(self, obj_):
         """Удалить запись из БД"""
+        self.delete_many([obj_])
+
+    def delete_many(self, objects):
+        """Удалить записи из БД одним executemany"""
         query = f'DELETE from {self.table_name} WHERE {self.id_name}=?'
-        id_ = getattr(obj_, self.id_name)
-        self.cursor.execute(query, (id_, ))
+        self.cursor.executemany(query, [(getattr(obj_, self.id_name), ) for obj_ in objects])
+        self.invalidate(objects)
+        self.mark_written()
         self.commit()
 
+    def mark_written(self):
+        """Запомнить таблицу для уведомления write_listeners после фиксации"""
+        if not hasattr(_transaction, 'tables'):
+            _transaction.tables = set()
+        _transaction.tables.add(self.table_name)
+
+    def invalidate(self, objects):
+        """
+        Удалить измененные объекты из IdentityMap и кэша. Строки кэша
+        сбрасываются еще раз после фиксации (или отката) транзакции: до нее
+        другой поток может закэшировать прежнюю строку, а текущий -
+        незафиксированную
+        """
+        identity_map = IdentityMap.get_current()
+        if self.cache and not hasattr(_transaction, 'invalidated'):
+            _transaction.invalidated = []
+        for obj_ in objects:
+            id_ = getattr(obj_, self.id_name)
+            if identity_map is not None:
+                identity_map.remove(self.table_name, id_)
+            if self.cache:
+                self.cache.invalidate(id_)
+                _transaction.invalidated.append((self.cache, id_))
+
+    def get_values(self, obj_) -> tuple:
+        """Значения полей объекта в порядке self.columns"""
+        return tuple(getattr(obj_, column) for column in self.columns)
+
     def commit(self):
+        if getattr(_transaction, 'depth', 0):
+            return
         try:
             self.connection.commit()
         except Exception as e:
             raise DbCommitException(e.args)
+        _emit_writes()
@@ -0,0 +1,89 @@
+import contextvars
+import threading
+import time
+from collections import OrderedDict
+
+
+class IdentityMap:
+    """
+    Реализация паттерна "Коллекция объектов": в пределах запроса
+    одной записи таблицы соответствует один объект.
+    Текущая коллекция хранится в contextvar: у каждого потока и у каждой
+    asyncio-задачи (и у кода, запущенного ею через run_sync) она своя
+    """
+    current = contextvars.ContextVar('identity_map', default=None)
+
+    def __init__(self):
+        self.objects = {}
+
+    def get(self, table_name, id_):
+        return self.objects.get((table_name, id_))
+
+    def add(self, table_name, id_, obj_):
+        self.objects[(table_name, id_)] = obj_
+
+    def remove(self, table_name, id_):
+        self.objects.pop((table_name, id_), None)
+
+    @staticmethod
+    def new_current():
+        """Создает в текущем контексте экземпляр объекта IdentityMap"""
+        __class__.set_current(IdentityMap())
+
+    @classmethod
+    def set_current(cls, identity_map):
+        """Устанавливает в текущем контексте экземпляр объекта IdentityMap"""
+        cls.current.set(identity_map)
+
+    @classmethod
+    def get_current(cls):
+        """Возвращает текущий объект IdentityMap или None"""
+        return cls.current.get()
+
+
+class EntityCache:
+    """
+    Общий для потоков процесса LRU-кэш строк таблицы с временем жизни ttl секунд.
+    Хранит строки, а не объекты, поэтому каждый запрос получает свой объект.
+    version - число сбросов: строка, прочитанная до сброса, не кэшируется
+    """
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version = 0
+        self._rows = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, id_):
+        with self._lock:
+            entry = self._rows.get(id_)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._rows[id_]
+                self.misses += 1
+                return None
+            self._rows.move_to_end(id_)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, id_, row, version=None):
+        """Закэшировать строку, прочитанную при версии version"""
+        with self._lock:
+            if version is not None and version != self.version:
+                return
+            self._rows[id_] = (time.monotonic() + self.ttl, row)
+            self._rows.move_to_end(id_)
+            if len(self._rows) > self.maxsize:
+                self._rows.popitem(last=False)
+
+    def invalidate(self, id_):
+        with self._lock:
+            self.version += 1
+            self._rows.pop(id_, None)
+
+    def clear(self):
+        with self._lock:
+            self.version += 1
+            self._rows.clear()
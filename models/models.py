@@ -1,13 +1,26 @@
 import abc
-import sqlite3
 import threading
 
-from models.data_mapper import ClassMapper, MapperNotFoundException
+from models.connection_pool import ConnectionPool
+from models.data_mapper import ClassMapper, MapperNotFoundException, IN_CHUNK_SIZE, PAGE_SIZE, transaction
+from models.identity_map import EntityCache
+from models.outbox import OutboxMapper
 from patterns.prototype import PrototypeMixin
-from patterns.observer import ObservableSubject, Observer
+from patterns.observer import EventRegistry, Observer
 
 
-conn = sqlite3.connect('db.sqlite', check_same_thread=False)
+DB_PATH = 'db.sqlite'
+
+pool = ConnectionPool(DB_PATH)
+
+# Кэш строк редко изменяемой таблицы категорий, общий для потоков процесса
+categories_cache = EntityCache(maxsize=1024, ttl=60)
+
+# Событие очереди outbox об изменении курса (payload - id_course)
+COURSE_UPDATED = 'course_updated'
+
+# Число уведомлений, отправляемых одним вызовом send()
+NOTIFY_BATCH_SIZE = 100
 
 
 class UnitOfWork:
@@ -34,25 +47,37 @@ class UnitOfWork:
         self.removed_objects.append(obj)
 
     def commit(self):
-        """Произвести действия по вставке, обновлению и удалению"""
-        self.insert_new()
-        self.update_dirty()
-        self.delete_removed()
+        """
+        Произвести действия по вставке, обновлению и удалению
+        в одной транзакции. При ошибке все изменения откатываются
+        """
+        with transaction(pool.connection()):
+            self.insert_new()
+            self.update_dirty()
+            self.delete_removed()
 
     def insert_new(self):
-        """Проходит по списку новых объектов, вызывает метод create маппера"""
-        for obj_ in self.new_objects:
-            MapperRegistry.get_mapper(obj_).create(obj_)
+        """Группирует новые объекты по мапперам, вызывает метод create_many маппера"""
+        for mapper, objects in self.group_by_mapper(self.new_objects):
+            mapper.create_many(objects)
 
     def update_dirty(self):
-        """Проходит по списку измененных объектов, вызывает метод update маппера"""
-        for obj_ in self.dirty_objects:
-            MapperRegistry.get_mapper(obj_).update(obj_)
+        """Группирует измененные объекты по мапперам, вызывает метод update_many маппера"""
+        for mapper, objects in self.group_by_mapper(self.dirty_objects):
+            mapper.update_many(objects)
 
     def delete_removed(self):
-        """Проходит по списку удаляемых объектов, вызывает метод delete маппера"""
-        for obj_ in self.removed_objects:
-            MapperRegistry.get_mapper(obj_).delete(obj_)
+        """Группирует удаляемые объекты по мапперам, вызывает метод delete_many маппера"""
+        for mapper, objects in self.group_by_mapper(self.removed_objects):
+            mapper.delete_many(objects)
+
+    @staticmethod
+    def group_by_mapper(objects):
+        """Возвращает пары (маппер, список объектов) в порядке регистрации"""
+        groups = {}
+        for obj_ in objects:
+            groups.setdefault(type(obj_).__name__, []).append(obj_)
+        return [(MapperRegistry.get_mapper_by_name(name), items) for name, items in groups.items()]
 
     @staticmethod
     def new_current():
@@ -114,18 +139,30 @@ class StudentMapper(ClassMapper):
         self.mapped_class = Student
         self.table_name = 'students'
         self.id_name = 'id_person'
+        self.columns = ('firstname', 'lastname', 'email')
 
-    def create(self, person):
-        """Вставить запись в таблицу"""
-        query = 'INSERT into students (firstname, lastname, email) VALUES (?, ?, ?)'
-        self.cursor.execute(query, (person.firstname, person.lastname, person.email))
-        self.commit()
+    def get_by_course(self, id_course) -> list:
+        """Получить список студентов, записанных на курс, одним запросом"""
+        query = 'SELECT s.* FROM students s ' \
+                'JOIN courses_students cs ON cs.id_student = s.id_person ' \
+                'WHERE cs.id_course=?'
+        return [self.load(item) for item in self.cursor.execute(query, (id_course,))]
 
-    def update(self, student):
-        """Обновить запись в БД"""
-        query = 'UPDATE students SET firstname=?, lastname=?, email=? WHERE id_person=?'
-        self.cursor.execute(query, (student.firstname, student.lastname, student.email, student.id_student))
-        self.commit()
+    def get_by_courses(self, ids) -> dict:
+        """
+        Словарь {id_course: список студентов} для списка курсов,
+        один запрос на каждые IN_CHUNK_SIZE курсов
+        """
+        ids = list(dict.fromkeys(ids))
+        students = {id_course: [] for id_course in ids}
+        for start in range(0, len(ids), IN_CHUNK_SIZE):
+            chunk = ids[start:start + IN_CHUNK_SIZE]
+            query = 'SELECT cs.id_course, s.* FROM students s ' \
+                    'JOIN courses_students cs ON cs.id_student = s.id_person ' \
+                    f'WHERE cs.id_course IN ({", ".join("?" * len(chunk))})'
+            for id_course, *item in self.cursor.execute(query, chunk):
+                students[id_course].append(self.load(item))
+        return students
 
 
 class Category(DomainObject):
@@ -150,18 +187,8 @@ class CategoryMapper(ClassMapper):
         self.mapped_class = Category
         self.table_name = 'categories'
         self.id_name = 'id_category'
-
-    def create(self, category):
-        """Вставить запись в таблицу"""
-        query = f'INSERT into categories (title, description) VALUES (?, ?)'
-        self.cursor.execute(query, (category.title, category.description))
-        self.commit()
-
-    def update(self, category):
-        """Обновить запись в БД"""
-        query = 'UPDATE categories SET title=?, description=? WHERE id_category=?'
-        self.cursor.execute(query, (category.title, category.description, category.id_category))
-        self.commit()
+        self.columns = ('title', 'description')
+        self.cache = categories_cache
 
 
 class Course(DomainObject, PrototypeMixin):
@@ -181,39 +208,55 @@ class Course(DomainObject, PrototypeMixin):
     def enroll(self, id_student):
         """Записать студента на курс"""
         mapper = MapperRegistry.get_mapper_by_name('CourseStudent')
-
-        # Проверка имеющейся записи в БД
-        if not mapper.get_by_filter({'id_course': self.id_course, 'id_student': id_student}):
-            cour_stud = CourseStudent(None, self.id_course, id_student)
-            mapper.create(cour_stud)
-        else:
+        if not mapper.create_if_missing(CourseStudent(None, self.id_course, id_student)):
             print('Запись уже существует')
 
 
-class CourseMapper(ClassMapper, ObservableSubject):
+class CourseMapper(ClassMapper):
     """
     Маппер объектов класса Course
     """
     def __init__(self, *args, **kwargs):
         ClassMapper.__init__(self, *args, **kwargs)
-        ObservableSubject.__init__(self)
         self.mapped_class = Course
         self.table_name = 'courses'
         self.id_name = 'id_course'
+        self.columns = ('title', 'id_category', 'description')
 
-    def create(self, course):
-        """Вставить запись в таблицу"""
-        query = 'INSERT into courses (title, id_category, description) VALUES (?, ?, ?)'
-        self.cursor.execute(query, (course.title, course.id_category, course.description))
-        self.commit()
+    def update_many(self, courses):
+        """
+        Обновить записи в БД. В той же транзакции поставить в очередь outbox
+        событие об изменении каждого курса, уведомления рассылает OutboxWorker
+        """
+        with transaction(self.connection):
+            super().update_many(courses)
+            outbox = MapperRegistry.get_mapper_by_name('Outbox')
+            outbox.put_many(COURSE_UPDATED, [course.id_course for course in courses])
 
-    def update(self, course):
-        """Обновить запись в БД. Отправить уведомление об обновлении"""
-        query = 'UPDATE courses SET title=?, id_category=?, description=? WHERE id_course=?'
-        self.cursor.execute(query, (course.title, course.id_category, course.description, course.id_course))
-        self._subject_name = course.id_course
-        self.notify()
-        self.commit()
+    def get_all_with_category(self) -> list:
+        """
+        Получить список курсов с названием категории (атрибут cat_title)
+        одним запросом с JOIN
+        """
+        query = 'SELECT c.*, cat.title FROM courses c ' \
+                'LEFT JOIN categories cat ON cat.id_category = c.id_category'
+        return self._with_category(self.cursor.execute(query))
+
+    def get_page_with_category(self, after=None, limit=PAGE_SIZE):
+        """Страница курсов с названием категории (keyset-пагинация по id_course)"""
+        query = 'SELECT c.*, cat.title FROM courses c ' \
+                'LEFT JOIN categories cat ON cat.id_category = c.id_category ' \
+                'WHERE c.id_course > ? ORDER BY c.id_course LIMIT ?'
+        rows = self._with_category(self.cursor.execute(query, (-1 if after is None else after, limit + 1)))
+        return self.make_page(rows, after, limit)
+
+    def _with_category(self, result) -> list:
+        rows = []
+        for *item, cat_title in result:
+            course = self.load(item)
+            course.cat_title = cat_title
+            rows.append(course)
+        return rows
 
 
 class CourseStudent(DomainObject):
@@ -235,17 +278,22 @@ class CourseStudentMapper(ClassMapper):
         self.mapped_class = CourseStudent
         self.table_name = 'courses_students'
         self.id_name = 'id_course_student'
+        self.columns = ('id_course', 'id_student')
 
-    def create(self, cour_stud) -> None:
-        query = 'INSERT into courses_students (id_course, id_student) VALUES (?, ?)'
-        self.cursor.execute(query, (cour_stud.id_course, cour_stud.id_student))
-        self.commit()
-
-    def update(self, cour_stud) -> None:
-        """Обновить запись в БД"""
-        query = 'UPDATE courses_students SET id_course=?, id_student=? WHERE id_course_student=?'
-        self.cursor.execute(query, (cour_stud.id_course, cour_stud.id_student, cour_stud.id_course_student))
+    def create_if_missing(self, cour_stud) -> bool:
+        """
+        Вставить запись, если ее еще нет. Повтор отсекает уникальный индекс
+        (id_course, id_student), поэтому одновременные запросы не приводят
+        к ошибке. Возвращает True, если запись добавлена
+        """
+        self.cursor.execute(
+            'INSERT OR IGNORE INTO courses_students (id_course, id_student) VALUES (?, ?)',
+            self.get_values(cour_stud))
+        created = self.cursor.rowcount > 0
+        if created:
+            self.mark_written()
         self.commit()
+        return created
 
 
 class MapperRegistry:
@@ -256,64 +304,79 @@ class MapperRegistry:
         'Student': StudentMapper,
         'Course': CourseMapper,
         'Category': CategoryMapper,
-        'CourseStudent': CourseStudentMapper
+        'CourseStudent': CourseStudentMapper,
+        'Outbox': OutboxMapper,
     }
 
     @classmethod
     def get_mapper(cls, obj_):
-        """Фабричный метод, создающий маппер по объекту класса"""
-        cls_name = type(obj_).__name__
-        if cls_name in cls.mappers:
-            return cls.mappers[cls_name](conn)
-        else:
-            raise MapperNotFoundException('Mapper не найден')
+        """Фабричный метод, возвращающий маппер по объекту класса"""
+        return cls.get_mapper_by_name(type(obj_).__name__)
 
     @classmethod
     def get_mapper_by_name(cls, cls_name):
-        """Фабричный метод, создающий маппер по имени класса"""
-        if cls_name in cls.mappers:
-            return cls.mappers[cls_name](conn)
-        else:
-            raise MapperNotFoundException('Mapper не найден')
+        """
+        Фабричный метод, возвращающий маппер по имени класса.
+        Мапперы создаются один раз на соединение потока и переиспользуются
+        """
+        thread_connection = pool.checkout()
+        mapper = thread_connection.mappers.get(cls_name)
+        if mapper is None:
+            if cls_name not in cls.mappers:
+                raise MapperNotFoundException('Mapper не найден')
+            mapper = cls.mappers[cls_name](thread_connection.connection)
+            thread_connection.mappers[cls_name] = mapper
+        return mapper
 
 
 class CourseChangeObserver(Observer, abc.ABC):
     """
     Абстрактный класс наблюдателя изменения курса
     """
-    def students(self, id_course) -> list:
+    def on_update(self, id_course):
+        """Действие при обновлении курса"""
+        self.on_update_many([id_course])
+
+    def on_update_many(self, ids):
         """
-        Вывод списка студентов, записанных на курс
+        Уведомить студентов об изменении курсов. Курсы и студенты читаются
+        общими запросами для всего списка, сообщения отправляются пачками
+        по NOTIFY_BATCH_SIZE
         """
-        cour_stud_mapper = CourseStudentMapper(conn)
-        stud_mapper = StudentMapper(conn)
-        courses_students = cour_stud_mapper.get_by_key('id_course', id_course)
-        students = [stud_mapper.get_by_id(item.id_student) for item in courses_students]
-        return students
+        courses = MapperRegistry.get_mapper_by_name('Course').get_by_ids(ids)
+        students = MapperRegistry.get_mapper_by_name('Student').get_by_courses(courses)
+        messages = [
+            self.message(student, course)
+            for id_course, course in courses.items()
+            for student in students[id_course]
+        ]
+        for start in range(0, len(messages), NOTIFY_BATCH_SIZE):
+            self.send(messages[start:start + NOTIFY_BATCH_SIZE])
+
+    @abc.abstractmethod
+    def message(self, student, course) -> str:
+        pass
+
+    def send(self, messages):
+        """Отправить пачку сообщений"""
+        for message in messages:
+            print(message)
 
 
 class SmsCourseChangeObserver(CourseChangeObserver):
     """
     Наблюдатель для уведомления по SMS
     """
-    def on_update(self, id_course):
-        """Действие при обновлении курса"""
-        course_mapper = CourseMapper(conn)
-        course = course_mapper.get_by_id(id_course)
-        for student in self.students(id_course):
-            print(f'SMS сообщение для {student.lastname}. Курс "{course}" был изменен')
+    def message(self, student, course):
+        return f'SMS сообщение для {student.lastname}. Курс "{course}" был изменен'
 
 
 class EmailCourseChangeObserver(CourseChangeObserver):
     """
     Наблюдатель для уведомления по электронной почте
     """
-    def on_update(self, id_course):
-        """Действие при обновлении курса"""
-        course_mapper = CourseMapper(conn)
-        course = course_mapper.get_by_id(id_course)
-        for student in self.students(id_course):
-            print(f'Письмо на {student.email}. Курс "{course}" был изменен')
+    def message(self, student, course):
+        return f'Письмо на {student.email}. Курс "{course}" был изменен'
 
 
 class CourseChangeObserverFactory:
@@ -333,3 +396,10 @@ class CourseChangeObserverFactory:
             return __class__.types[type_]()
         except ValueError as e:
             print(e.args)
+
+
+# Подписки на события очереди outbox. Наблюдатели создаются один раз
+# при импорте, OutboxWorker вызывает их через готовые кортежи подписок
+events = EventRegistry()
+events.subscribe(COURSE_UPDATED, 'sms', CourseChangeObserverFactory.create_observer('sms').on_update_many)
+events.subscribe(COURSE_UPDATED, 'email', CourseChangeObserverFactory.create_observer('email').on_update_many)
@@ -0,0 +1,218 @@
+import json
+import os
+import threading
+import time
+
+from models.data_mapper import ClassMapper
+
+
+# Число событий, захватываемых воркером за один раз
+OUTBOX_BATCH_SIZE = 100
+
+# Число потоков, обрабатывающих очередь
+OUTBOX_WORKERS = 2
+
+# Интервал опроса очереди (секунд), если не было сигнала о новых событиях
+OUTBOX_POLL_INTERVAL = 1.0
+
+# Время (секунд), на которое событие захватывается воркером. Если воркер
+# завершился, не обработав событие, оно снова становится доступным
+OUTBOX_LOCK_TIMEOUT = 60
+
+# Число попыток обработки события и задержка перед повтором (секунд,
+# удваивается с каждой попыткой). После последней попытки статус - failed
+OUTBOX_MAX_ATTEMPTS = 5
+OUTBOX_RETRY_DELAY = 2
+
+
+class OutboxEvent:
+    """
+    Событие очереди. done - имена обработчиков, уже обработавших событие
+    """
+    def __init__(self, id_event, event, payload, attempts=0, done=''):
+        self.id_event = id_event
+        self.event = event
+        self.payload = payload
+        self.attempts = attempts
+        self.done = set(filter(None, done.split(',')))
+
+
+class OutboxMapper(ClassMapper):
+    """
+    Маппер очереди событий (таблица outbox)
+    """
+    def __init__(self, connection):
+        super().__init__(connection)
+        self.mapped_class = OutboxEvent
+        self.table_name = 'outbox'
+        self.id_name = 'id_event'
+        self.columns = ('event', 'payload')
+
+    def put_many(self, event, payloads):
+        """
+        Поставить события в очередь. Внутри transaction() события
+        фиксируются вместе с остальными изменениями
+        """
+        self.cursor.executemany(
+            'INSERT INTO outbox (event, payload) VALUES (?, ?)',
+            [(event, json.dumps(payload)) for payload in payloads])
+        self.mark_written()
+        self.commit()
+
+    def claim(self, limit=OUTBOX_BATCH_SIZE, lock_timeout=OUTBOX_LOCK_TIMEOUT) -> list:
+        """
+        Захватить до limit доступных событий. Выборка и захват выполняются
+        одним UPDATE, поэтому воркеры разных процессов не получат
+        одно событие дважды. Пустая очередь проверяется чтением, без
+        блокировки БД на запись
+        """
+        now = time.time()
+        exists = self.cursor.execute(
+            'SELECT EXISTS (SELECT 1 FROM outbox WHERE status = ? AND available_at <= ? '
+            'AND (locked_until IS NULL OR locked_until < ?))', ('pending', now, now)).fetchone()[0]
+        if not exists:
+            return []
+        rows = self.cursor.execute(
+            'UPDATE outbox SET locked_until = ? WHERE id_event IN ('
+            'SELECT id_event FROM outbox WHERE status = ? AND available_at <= ? '
+            'AND (locked_until IS NULL OR locked_until < ?) ORDER BY id_event LIMIT ?) '
+            'RETURNING id_event, event, payload, attempts, done',
+            (now + lock_timeout, 'pending', now, now, limit)).fetchall()
+        self.commit()
+        return [OutboxEvent(id_event, event, json.loads(payload), attempts, done)
+                for id_event, event, payload, attempts, done in sorted(rows)]
+
+    def complete(self, events):
+        """Удалить обработанные события"""
+        self.cursor.executemany('DELETE FROM outbox WHERE id_event = ?', [(e.id_event, ) for e in events])
+        self.commit()
+
+    def retry(self, events, errors, max_attempts=OUTBOX_MAX_ATTEMPTS, delay=OUTBOX_RETRY_DELAY):
+        """
+        Вернуть события в очередь с задержкой или пометить failed после
+        max_attempts попыток. errors - {id_event: текст ошибки}
+        """
+        now = time.time()
+        values = []
+        for e in events:
+            attempts = e.attempts + 1
+            status = 'failed' if attempts >= max_attempts else 'pending'
+            values.append((status, attempts, now + delay * 2 ** e.attempts, ','.join(sorted(e.done)),
+                           errors.get(e.id_event), e.id_event))
+        self.cursor.executemany(
+            'UPDATE outbox SET status = ?, attempts = ?, available_at = ?, locked_until = NULL, '
+            'done = ?, error = ? WHERE id_event = ?', values)
+        self.commit()
+
+    def stats(self) -> dict:
+        """Число событий по статусам"""
+        return dict(self.cursor.execute('SELECT status, COUNT(*) FROM outbox GROUP BY status'))
+
+
+class OutboxWorker:
+    """
+    Пул фоновых потоков, обрабатывающих очередь событий.
+    get_mapper - функция, возвращающая OutboxMapper соединения текущего потока,
+    events - EventRegistry, обработчики которого принимают список payload,
+    release - функция, возвращающая соединение потока в пул после каждой пачки.
+    События пачки группируются по типу, и каждый обработчик получает
+    payload всех событий группы одним вызовом
+    """
+    def __init__(self, get_mapper, events, release=None, workers=OUTBOX_WORKERS,
+                 batch_size=OUTBOX_BATCH_SIZE, poll_interval=OUTBOX_POLL_INTERVAL):
+        self.get_mapper = get_mapper
+        self.events = events
+        self.release = release
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.processed = 0
+        self.failed = 0
+        self._threads = []
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # после fork потоки не наследуются - запускаем заново
+            self._pid = os.getpid()
+            self._stopping.clear()
+            self._threads = [
+                threading.Thread(target=self._run, name=f'outbox-{i}', daemon=True)
+                for i in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._pid = None
+
+    def wake(self):
+        """Сообщить воркерам о новых событиях"""
+        if self._pid != os.getpid():
+            self.start()
+        self._wakeup.set()
+
+    def on_write(self, *tables):
+        """Слушатель data_mapper.write_listeners"""
+        if 'outbox' in tables:
+            self.wake()
+
+    def process_batch(self) -> int:
+        """Обработать одну пачку событий, возвращает число захваченных событий"""
+        mapper = self.get_mapper()
+        events = mapper.claim(self.batch_size)
+        if not events:
+            return 0
+
+        groups = {}
+        for event in events:
+            groups.setdefault(event.event, []).append(event)
+
+        errors = {}
+        for name, group in groups.items():
+            subscriptions = self.events.get(name)
+            if not subscriptions:
+                errors.update((event.id_event, f'Нет обработчиков события {name}') for event in group)
+                continue
+            for subscription in subscriptions:
+                pending = [event for event in group if subscription.name not in event.done]
+                if not pending:
+                    continue
+                try:
+                    subscription([event.payload for event in pending])
+                except Exception as e:
+                    errors.update((event.id_event, f'{subscription.name}: {e!r}') for event in pending)
+                else:
+                    for event in pending:
+                        event.done.add(subscription.name)
+
+        mapper.complete([event for event in events if event.id_event not in errors])
+        if errors:
+            mapper.retry([event for event in events if event.id_event in errors], errors)
+        with self._lock:
+            self.processed += len(events) - len(errors)
+            self.failed += len(errors)
+        return len(events)
+
+    def _run(self):
+        while not self._stopping.is_set():
+            try:
+                claimed = self.process_batch()
+            except Exception as e:
+                print(f'Ошибка обработки очереди событий: {e!r}')
+                claimed = 0
+            finally:
+                if self.release is not None:
+                    self.release()
+            if claimed < self.batch_size:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
@@ -0,0 +1,156 @@
+from functools import lru_cache
+
+
+class ColumnNotFoundException(Exception):
+    def __init__(self, args):
+        super().__init__(f'Поле не найдено: {args}')
+
+
+class OperatorNotFoundException(Exception):
+    def __init__(self, args):
+        super().__init__(f'Оператор не поддерживается: {args}')
+
+
+OPERATORS = {
+    'eq': '=',
+    'ne': '!=',
+    'lt': '<',
+    'lte': '<=',
+    'gt': '>',
+    'gte': '>=',
+    'in': 'IN',
+}
+
+# Число различных форм запросов, для которых хранится готовый текст SQL.
+# Сами подготовленные выражения кэширует sqlite3 в каждом соединении
+# (параметр cached_statements), ключом служит текст SQL
+SQL_CACHE_SIZE = 256
+
+
+def _in_size(count):
+    """Размер списка IN, округленный вверх до степени двойки"""
+    size = 1
+    while size < count:
+        size *= 2
+    return size
+
+
+@lru_cache(maxsize=SQL_CACHE_SIZE)
+def build_select(table_name, where, order_by, limit, offset) -> str:
+    """Текст SELECT-запроса по его форме"""
+    query = f'SELECT * FROM {table_name}'
+    if where:
+        conditions = []
+        for column, operator, size in where:
+            if operator == 'IN':
+                conditions.append(f'{column} IN ({", ".join("?" * size)})')
+            else:
+                conditions.append(f'{column}{operator}?')
+        query = f'{query} WHERE {" AND ".join(conditions)}'
+    if order_by:
+        query = f'{query} ORDER BY {", ".join(f"{column} {direction}" for column, direction in order_by)}'
+    if limit:
+        query = f'{query} LIMIT ?'
+    elif offset:
+        # SQLite допускает OFFSET только после LIMIT, -1 - без ограничения
+        query = f'{query} LIMIT -1'
+    if offset:
+        query = f'{query} OFFSET ?'
+    return query
+
+
+class Query:
+    """
+    Построитель параметризованных SELECT-запросов к таблице маппера.
+    Имена полей проверяются по полям маппера, значения всегда передаются
+    параметрами, поэтому запросы одной формы используют один план
+    """
+    def __init__(self, mapper):
+        self.mapper = mapper
+        self._where = []
+        self._params = []
+        self._order_by = []
+        self._limit = None
+        self._offset = None
+
+    def where(self, column, operator, value):
+        """Добавить условие column <operator> value, operator - ключ OPERATORS"""
+        self._check_column(column)
+        if operator not in OPERATORS:
+            raise OperatorNotFoundException(operator)
+        operator = OPERATORS[operator]
+
+        if operator == 'IN':
+            values = list(value)
+            if not values:
+                # пустой IN ничего не находит
+                self._where.append(('1', '=', 0))
+                self._params.append(0)
+                return self
+            # дополняем список последним значением до степени двойки,
+            # чтобы число форм запроса не росло с каждым размером списка
+            size = _in_size(len(values))
+            values.extend(values[-1:] * (size - len(values)))
+            self._where.append((column, operator, size))
+            self._params.extend(values)
+        else:
+            self._where.append((column, operator, 1))
+            self._params.append(value)
+        return self
+
+    def filter(self, **filters):
+        """Добавить условия вида column=value или column__operator=value"""
+        for key, value in filters.items():
+            column, _, operator = key.partition('__')
+            self.where(column, operator or 'eq', value)
+        return self
+
+    def order_by(self, *columns):
+        """Сортировка по полям, '-column' - по убыванию"""
+        for column in columns:
+            direction = 'ASC'
+            if column.startswith('-'):
+                column = column[1:]
+                direction = 'DESC'
+            self._check_column(column)
+            self._order_by.append((column, direction))
+        return self
+
+    def limit(self, limit):
+        self._limit = int(limit)
+        return self
+
+    def offset(self, offset):
+        self._offset = int(offset)
+        return self
+
+    def sql(self) -> tuple:
+        """Текст запроса и параметры"""
+        query = build_select(
+            self.mapper.table_name,
+            tuple(self._where),
+            tuple(self._order_by),
+            self._limit is not None,
+            self._offset is not None,
+        )
+        params = list(self._params)
+        if self._limit is not None:
+            params.append(self._limit)
+        if self._offset is not None:
+            params.append(self._offset)
+        return query, params
+
+    def execute(self, cursor=None):
+        query, params = self.sql()
+        return (cursor or self.mapper.cursor).execute(query, params)
+
+    def all(self) -> list:
+        return [self.mapper.load(item) for item in self.execute()]
+
+    def first(self):
+        item = self.limit(1).execute().fetchone()
+        return self.mapper.load(item) if item else None
+
+    def _check_column(self, column):
+        if column != self.mapper.id_name and column not in self.mapper.columns:
+            raise ColumnNotFoundException(f'{self.mapper.table_name}.{column}')
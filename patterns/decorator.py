@@ -1,23 +1,20 @@
-import datetime
-
-
-def func_debug(func, cls=None):
-    def wrapper(*args, **kwargs):
-        class_name = cls.__name__ if cls else 'None'
-        print(f'{datetime.datetime.now()} - Запуск метода {func.__name__}'
-              f' класса {class_name}')
-        return func(*args, **kwargs)
-    return wrapper
+from framework.tracing import traced, enabled, CONTROLLER, METHOD
 
 
 def class_debug(cls):
-    cls.__call__ = func_debug(cls.__call__, cls)
+    """
+    Трассировка вызовов контроллера (уровень CONTROLLER) и его методов
+    (уровень METHOD). При выключенной трассировке класс не изменяется
+    """
+    cls.__call__ = traced(cls.__call__, 'controller', f'{cls.__name__}.__call__', CONTROLLER)
+    if not enabled(METHOD):
+        return cls
     for item in dir(cls):
         if item.startswith('__'):
             continue
         attr = getattr(cls, item)
         if hasattr(attr, '__call__'):
-            dec_method = func_debug(attr, cls)
+            dec_method = traced(attr, 'method', f'{cls.__name__}.{item}')
             setattr(cls, item, dec_method)
     return cls
 
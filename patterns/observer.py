@@ -1,5 +1,6 @@
 import abc
-from patterns.decorator import class_debug
+import threading
+import time
 
 
 class Observer(metaclass=abc.ABCMeta):
@@ -11,7 +12,6 @@ class Observer(metaclass=abc.ABCMeta):
         pass
 
 
-@class_debug
 class ObservableSubject:
    def __init__(self):
        self._observers = set()
@@ -28,3 +28,71 @@ class ObservableSubject:
    def notify(self):
        for observer in self._observers:
            observer.on_update(self._subject_name)
+
+
+class Subscription:
+    """Обработчик события со счетчиками вызовов, ошибок и времени выполнения"""
+    __slots__ = ('name', 'handler', 'calls', 'errors', 'total_time', '_lock')
+
+    def __init__(self, name, handler):
+        self.name = name
+        self.handler = handler
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return self.handler(*args, **kwargs)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.calls += 1
+                self.errors += failed
+                self.total_time += duration
+
+    def stats(self) -> dict:
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'total_ms': round(self.total_time * 1000, 3),
+            'avg_ms': round(self.total_time * 1000 / self.calls, 3) if self.calls else 0.0,
+        }
+
+
+class EventRegistry:
+    """
+    Подписки "событие -> обработчики", составляемые при старте приложения.
+    Обработчики создаются один раз, для каждого события хранится готовый
+    кортеж подписок, поэтому emit() - это только проход по кортежу
+    """
+    def __init__(self):
+        self._subscriptions = {}
+
+    def subscribe(self, event, name, handler):
+        """Подписать handler (вызываемый объект) на событие под именем name"""
+        if any(subscription.name == name for subscription in self.get(event)):
+            raise ValueError(f'Обработчик {name} уже подписан на {event}')
+        self._subscriptions[event] = self.get(event) + (Subscription(name, handler), )
+
+    def get(self, event) -> tuple:
+        """Кортеж подписок события"""
+        return self._subscriptions.get(event, ())
+
+    def emit(self, event, *args, **kwargs):
+        """Вызвать обработчики события в текущем потоке"""
+        for subscription in self._subscriptions.get(event, ()):
+            subscription(*args, **kwargs)
+
+    def stats(self) -> dict:
+        """Счетчики обработчиков {событие: {имя: {...}}}"""
+        return {
+            event: {subscription.name: subscription.stats() for subscription in subscriptions}
+            for event, subscriptions in self._subscriptions.items()
+        }